@@ -0,0 +1,183 @@
+# ----------------------------------------------------------------------------
+# WAYBAR PANELS COMMON
+# ----------------------------------------------------------------------------
+# Helpers shared by the cpu and memory panels, imported from the panels'
+# own directory.
+# Features:
+# - procfs/sysfs roots that the bench can point at fixture trees
+# - Per-boot JSON cache for hardware inventory
+# - Counter handover between single-shot runs
+# - Memory-mapped history ring
+# - /proc/[pid]/stat parsing
+# - The --stream output loop
+# ----------------------------------------------------------------------------
+
+import json
+import mmap
+import os
+import pathlib
+import struct
+import time
+from array import array
+
+# ---------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------
+# procfs/sysfs mount points, overridable to run against recorded fixture trees
+PROC = os.environ.get("WAYBAR_PROC_ROOT", "/proc")
+SYS = os.environ.get("WAYBAR_SYS_ROOT", "/sys")
+
+# Per-tick state of single-shot runs, kept in RAM (tmpfs) when possible
+STATE_DIR = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+CACHE_DIR = pathlib.Path.home() / ".cache" / "waybar"
+
+# ---------------------------------------------------
+# BOOT CACHE
+# ---------------------------------------------------
+# Hardware can't change without a reboot, so it is resolved once and stored
+# as JSON next to the boot_id it was computed for.
+def get_boot_id():
+    try:
+        with open(f"{PROC}/sys/kernel/random/boot_id", "r") as f: return f.read().strip()
+    except: return None
+
+def boot_cached(name, build, version, retry=None):
+    """
+    build(), or what it returned earlier this boot for the same version.
+    With retry set, an empty result is only kept for that many seconds, so
+    a build that failed early in the boot gets another chance.
+    """
+    path = CACHE_DIR / f"{name}.json"
+    key = {"boot_id": get_boot_id(), "version": version}
+    try:
+        cached = json.loads(path.read_text())
+        expires = cached.get("expires")
+        if key["boot_id"] and cached["key"] == key and (expires is None or time.time() < expires): return cached["data"]
+    except: pass
+
+    data = build()
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}")
+        expires = time.time() + retry if retry is not None and not data else None
+        tmp.write_text(json.dumps({"key": key, "data": data, "expires": expires}))
+        os.replace(tmp, path)
+    except: pass
+    return data
+
+# ---------------------------------------------------
+# COUNTERS (single-shot mode)
+# ---------------------------------------------------
+# --stream keeps the previous tick's counters in memory, single runs hand
+# them over to the next run through a small JSON file. Per-process tables
+# ({(pid, starttime): value}) are stored flat, `tables` gives the number of
+# values per entry.
+def load_counters(path, tables):
+    try:
+        with open(path, "r") as f: counters = json.load(f)
+        for name, width in tables.items():
+            flat, step = counters.get(name, []), 2 + width
+            rows = (flat[i:i + step] for i in range(0, len(flat), step))
+            counters[name] = {(row[0], row[1]): row[2] if width == 1 else tuple(row[2:]) for row in rows}
+        return counters
+    except: return {}
+
+def save_counters(path, counters, tables):
+    saved = dict(counters)
+    for name, width in tables.items():
+        saved[name] = [v for key, value in counters.get(name, {}).items()
+                       for v in (*key, *(value if width > 1 else (value,)))]
+    tmp = f"{path}.{os.getpid()}"
+    try:
+        # STATE_DIR may be the shared /tmp: never follow a planted symlink
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, "w") as f: json.dump(saved, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except:
+        try: os.unlink(tmp)
+        except OSError: pass
+
+# ---------------------------------------------------
+# HISTORY
+# ---------------------------------------------------
+HISTORY_HEADER = struct.Struct("<4sIIQ4x")  # magic, columns, capacity, head (padded to keep rows 8-aligned)
+
+class HistoryRing:
+    """
+    Fixed-size ring of rows in a memory-mapped file, float32 ("f") or
+    float64 ("d") columns. Appending writes a single row in place and bumps
+    the head index, so the cost doesn't depend on how much history is kept.
+    """
+    def __init__(self, path, magic, columns, capacity, typecode="d"):
+        self.columns, self.capacity, self.typecode = columns, capacity, typecode
+        size = HISTORY_HEADER.size + columns * capacity * array(typecode).itemsize
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        found, cols, cap, self.head = HISTORY_HEADER.unpack_from(self.mm, 0)
+        if (found, cols, cap) != (magic, columns, capacity):
+            # New file, or the layout changed (column count, capacity)
+            self.head = 0
+            self.mm[:] = bytes(size)
+            HISTORY_HEADER.pack_into(self.mm, 0, magic, columns, capacity, 0)
+        self.rows = memoryview(self.mm)[HISTORY_HEADER.size:].cast(typecode)
+
+    def append(self, values):
+        """Writes one row, missing columns are zero."""
+        row = array(self.typecode, values[:self.columns])
+        row.extend([0.0] * (self.columns - len(row)))
+        offset = (self.head % self.capacity) * self.columns
+        self.rows[offset:offset + self.columns] = row
+        self.head += 1
+        struct.pack_into("<Q", self.mm, 12, self.head)
+
+    def since(self, start):
+        """Rows whose first column is at or after start, oldest first."""
+        rows = []
+        for i in range(self.head - 1, max(0, self.head - self.capacity) - 1, -1):
+            offset = (i % self.capacity) * self.columns
+            row = self.rows[offset:offset + self.columns].tolist()
+            if row[0] < start: break
+            rows.append(row)
+        rows.reverse()
+        return rows
+
+def open_history(path, magic, columns, capacity, typecode="d"):
+    try: return HistoryRing(path, magic, columns, capacity, typecode)
+    except: return None
+
+# ---------------------------------------------------
+# PROCESSES
+# ---------------------------------------------------
+def read_pid_stat(pid):
+    """
+    Returns (comm, fields) from /proc/[pid]/stat, fields starting at the
+    state (field 3 in proc(5), so utime is fields[11]). comm may contain
+    spaces and parentheses, the fields start after the last ')'.
+    """
+    with open(f"{PROC}/{pid}/stat", "rb") as f: raw = f.read()
+    end = raw.rindex(b")")
+    return raw[raw.index(b"(") + 1:end], raw[end + 2:].split()
+
+# ---------------------------------------------------
+# STREAM MODE
+# ---------------------------------------------------
+def stream(tick, wait):
+    """
+    --stream loop: prints tick() as a JSON line, then wait(seconds the tick
+    took), until waybar closes the pipe (reload/exit). Counters live in
+    memory for the lifetime of the process.
+    """
+    try:
+        while True:
+            started = time.monotonic()
+            print(json.dumps(tick()), flush=True)
+            wait(time.monotonic() - started)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
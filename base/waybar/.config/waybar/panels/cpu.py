@@ -8,27 +8,42 @@
 # - Power usage (RAPL)
 # - Temperature monitoring
 # - Top processes consuming CPU
+#
+# Usage:
+#   cpu.py            print a single JSON line and exit (waybar "interval")
+#   cpu.py --stream   stay alive and print one JSON line every tick
 # ----------------------------------------------------------------------------
 
 import json
-import psutil
 import subprocess
 import re
 import os
+import sys
 import time
 import shutil
-import pickle
-from collections import deque
 import math
 import pathlib
 import glob
+import heapq
+
+from common import PROC, SYS, STATE_DIR, boot_cached, load_counters, save_counters, open_history, read_pid_stat, stream
 
 # ---------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------
 CPU_ICON_GENERAL = ""
-HISTORY_FILE = "/tmp/waybar_cpu_history.pkl"
-TOOLTIP_WIDTH = 50
+CPU_SENSORS = ["k10temp", "coretemp", "zenpower"]  # hwmon drivers reporting CPU temperature
+HISTORY_FILE = os.path.join(STATE_DIR, "waybar_cpu_history.bin")
+HISTORY_MAGIC = b"WCPU"
+COUNTERS_FILE = os.path.join(STATE_DIR, "waybar_cpu_counters.json")
+COUNTER_TABLES = {"procs": 1}  # {(pid, starttime): ticks}
+CACHE_VERSION = 4  # bump when the layout of a boot cache changes
+HISTORY_LENGTH = 4096  # samples kept per core (~5.7h at 5s)
+TOP_PROCESSES = 3
+DIES_PER_ROW = 2
+CLIP_RATIO = 0.85    # a busy core below this fraction of its allowed max is clipped
+LIMIT_RATIO = 0.95   # package power above this fraction of a RAPL limit is power-limited
+STREAM_INTERVAL = 5  # seconds between two lines in --stream mode
 
 # ---------------------------------------------------
 # THEME & COLORS
@@ -60,13 +75,13 @@ COLORS = load_theme_colors()
 SECTION_COLORS = {"CPU": {"icon": COLORS["red"], "text": COLORS["red"]}}
 
 COLOR_TABLE = [
-    {"color": COLORS["blue"],           "cpu_gpu_temp": (0, 35),   "cpu_power": (0.0, 30)},
-    {"color": COLORS["cyan"],           "cpu_gpu_temp": (36, 45),  "cpu_power": (31.0, 60)},
-    {"color": COLORS["green"],          "cpu_gpu_temp": (46, 54),  "cpu_power": (61.0, 90)},
-    {"color": COLORS["yellow"],         "cpu_gpu_temp": (55, 65),  "cpu_power": (91.0, 120)},
-    {"color": COLORS["bright_yellow"],  "cpu_gpu_temp": (66, 75),  "cpu_power": (121.0,150)},
-    {"color": COLORS["bright_red"],     "cpu_gpu_temp": (76, 85),  "cpu_power": (151.0,180)},
-    {"color": COLORS["red"],            "cpu_gpu_temp": (86, 999), "cpu_power": (181.0,999)}
+    {"color": COLORS["blue"],           "cpu_gpu_temp": (0, 35),   "cpu_power": (0.0, 30),   "cpu_freq": (0, 30)},
+    {"color": COLORS["cyan"],           "cpu_gpu_temp": (36, 45),  "cpu_power": (31.0, 60),  "cpu_freq": (31, 45)},
+    {"color": COLORS["green"],          "cpu_gpu_temp": (46, 54),  "cpu_power": (61.0, 90),  "cpu_freq": (46, 60)},
+    {"color": COLORS["yellow"],         "cpu_gpu_temp": (55, 65),  "cpu_power": (91.0, 120), "cpu_freq": (61, 75)},
+    {"color": COLORS["bright_yellow"],  "cpu_gpu_temp": (66, 75),  "cpu_power": (121.0,150), "cpu_freq": (76, 85)},
+    {"color": COLORS["bright_red"],     "cpu_gpu_temp": (76, 85),  "cpu_power": (151.0,180), "cpu_freq": (86, 95)},
+    {"color": COLORS["red"],            "cpu_gpu_temp": (86, 999), "cpu_power": (181.0,999), "cpu_freq": (96, 999)}
 ]
 
 def get_color(value, metric_type):
@@ -82,9 +97,19 @@ def get_color(value, metric_type):
 # ---------------------------------------------------
 # HARDWARE DETECTION
 # ---------------------------------------------------
+def read_sysfs_int(path, default=0):
+    try:
+        with open(path, "r") as f: return int(f.read().strip())
+    except: return default
+
+def read_sysfs_str(path, default=None):
+    try:
+        with open(path, "r") as f: return f.read().strip()
+    except: return default
+
 def get_cpu_name():
     try:
-        with open("/proc/cpuinfo", "r") as f:
+        with open(f"{PROC}/cpuinfo", "r") as f:
             for line in f:
                 if "model name" in line:
                     return line.split(":")[1].strip()
@@ -92,100 +117,409 @@ def get_cpu_name():
         pass
     return "Unknown CPU"
 
-def get_rapl_path():
-    # Find the energy_uj file for package-0 (CPU)
-    base = "/sys/class/powercap"
-    if not os.path.exists(base): return None
+def get_energy_zones():
+    """
+    Every powercap zone and subzone exposing an energy counter: package-N,
+    core, uncore, dram, psys... (intel-rapl:N and intel-rapl:N:M, also used
+    by AMD). Falls back to the amd_energy hwmon driver without powercap.
+    """
+    zones = []
+    for zone_dir in sorted(glob.glob(f"{SYS}/class/powercap/*:*")):
+        zone_id = os.path.basename(zone_dir)
+        # intel-rapl-mmio exposes the same package counter a second time
+        if zone_id.startswith("intel-rapl-mmio") or not os.path.exists(f"{zone_dir}/energy_uj"): continue
+        parts = zone_id.split(":")
+        limits = []
+        for limit_file in sorted(glob.glob(f"{zone_dir}/constraint_*_power_limit_uw")):
+            prefix = limit_file[:-len("power_limit_uw")]
+            limits.append({"name": read_sysfs_str(f"{prefix}name", os.path.basename(prefix)[:-1]), "path": limit_file})
+        zones.append({
+            "id": zone_id,
+            "name": read_sysfs_str(f"{zone_dir}/name", zone_id),
+            "parent": ":".join(parts[:-1]) if len(parts) > 2 else None,
+            "dir": zone_dir,
+            "paths": [f"{zone_dir}/energy_uj"],
+            "max_range": read_sysfs_int(f"{zone_dir}/max_energy_range_uj", None),
+            "limits": limits,
+        })
+    if zones: return zones
+
+    # amd_energy: one Esocket counter per package plus one Ecore counter per core
+    for name_file in sorted(glob.glob(f"{SYS}/class/hwmon/hwmon*/name")):
+        if read_sysfs_str(name_file) != "amd_energy": continue
+        cores = []
+        for label_file in sorted(glob.glob(os.path.join(os.path.dirname(name_file), "energy*_label"))):
+            label, path = read_sysfs_str(label_file, ""), label_file.replace("_label", "_input")
+            if label.startswith("Esocket"):
+                zones.append({"id": label, "name": f"package-{label[7:]}", "parent": None, "dir": None, "paths": [path], "max_range": None, "limits": []})
+            else:
+                cores.append(path)
+        if cores:
+            zones.append({"id": "Ecores", "name": "cores", "parent": None, "dir": None, "paths": cores, "max_range": None, "limits": []})
+    return zones
+
+def get_temp_inputs():
+    paths = []
+    for name_file in sorted(glob.glob(f"{SYS}/class/hwmon/hwmon*/name")):
+        try:
+            with open(name_file, "r") as f: name = f.read().strip()
+        except OSError: continue
+        if name in CPU_SENSORS:
+            paths.extend(sorted(glob.glob(os.path.join(os.path.dirname(name_file), "temp*_input"))))
+    return paths
+
+def get_cpufreq():
+    cpufreq = []
+    for freq_dir in glob.glob(f"{SYS}/devices/system/cpu/cpu[0-9]*/cpufreq"):
+        cpufreq.append({
+            "cpu": int(os.path.basename(os.path.dirname(freq_dir))[3:]),
+            "cur": f"{freq_dir}/scaling_cur_freq",
+            "max": f"{freq_dir}/scaling_max_freq",
+            "hw_max": read_sysfs_int(f"{freq_dir}/cpuinfo_max_freq"),
+            "governor": f"{freq_dir}/scaling_governor",
+            "epp": f"{freq_dir}/energy_performance_preference" if os.path.exists(f"{freq_dir}/energy_performance_preference") else None,
+        })
+    return sorted(cpufreq, key=lambda entry: entry["cpu"])
+
+def get_throttle_counters():
+    """thermal_throttle/*_count files, the package_* ones only once per package."""
+    paths, seen = [], set()
+    for throttle_dir in sorted(glob.glob(f"{SYS}/devices/system/cpu/cpu[0-9]*/thermal_throttle")):
+        package = read_sysfs_int(os.path.join(os.path.dirname(throttle_dir), "topology/physical_package_id"))
+        for path in sorted(glob.glob(f"{throttle_dir}/*_count")):
+            name = os.path.basename(path)
+            if name.startswith("package_"):
+                if (package, name) in seen: continue
+                seen.add((package, name))
+            paths.append(path)
+    return paths
+
+def discover_hardware():
+    """Resolves the exact files read on every tick."""
+    return {
+        "cpu_name": get_cpu_name(),
+        "temp_inputs": get_temp_inputs(),
+        "energy_zones": get_energy_zones(),
+        "cpufreq": get_cpufreq(),
+        "throttle_counts": get_throttle_counters(),
+    }
 
-    # Search for intel-rapl or similar directories
-    # Usually intel-rapl:0 is the package
-    paths = glob.glob(f"{base}/*/energy_uj")
-    for p in paths:
-        if "intel-rapl:0" in p or "package" in p:
-            return p
-    # Fallback to first found
-    return paths[0] if paths else None
+class SysfsBatch:
+    """
+    Keeps a list of sysfs files open and re-reads all of them with pread,
+    sysfs regenerates the value on every read at offset 0.
+    """
+    def __init__(self, paths):
+        self.fds = []
+        for path in paths:
+            try: self.fds.append(os.open(path, os.O_RDONLY) if path else None)
+            except OSError: self.fds.append(None)
+
+    def read(self):
+        values = []
+        for fd in self.fds:
+            try: values.append(os.pread(fd, 64, 0).decode().strip() if fd is not None else None)
+            except OSError: values.append(None)
+        return values
 
 # ---------------------------------------------------
-# HISTORY
+# TOPOLOGY
 # ---------------------------------------------------
-def load_history():
-    try:
-        with open(HISTORY_FILE, 'rb') as f:
-            return pickle.load(f)
-    except:
-        return {'cpu': deque(maxlen=TOOLTIP_WIDTH), 'per_core': {}}
-
-def save_history(cpu_hist, per_core_hist):
-    try:
-        with open(HISTORY_FILE, 'wb') as f:
-            pickle.dump({'cpu': cpu_hist, 'per_core': per_core_hist}, f)
-    except: pass
+def read_topology():
+    """
+    Groups online CPUs into dies: one per package/die/L3 domain (an AMD CCD
+    has its own L3), each die being a list of cores and each core the list
+    of its SMT siblings.
+    """
+    groups = {}
+    for topo in glob.glob(f"{SYS}/devices/system/cpu/cpu[0-9]*/topology"):
+        cpu_dir = os.path.dirname(topo)
+        cpu = int(os.path.basename(cpu_dir)[3:])
+        key = (
+            read_sysfs_int(f"{topo}/physical_package_id"),
+            read_sysfs_int(f"{topo}/die_id"),
+            read_sysfs_int(f"{cpu_dir}/cache/index3/id", -1),
+        )
+        core_id = read_sysfs_int(f"{topo}/core_id", cpu)
+        groups.setdefault(key, {}).setdefault(core_id, []).append(cpu)
+
+    dies, per_package = [], {}
+    for (package, _, _), cores in sorted(groups.items()):
+        index = per_package[package] = per_package.get(package, -1) + 1
+        siblings = sorted(sorted(cpus) for cpus in cores.values())
+        dies.append({"package": package, "die": index, "cores": siblings})
+    return dies
 
 # ---------------------------------------------------
-# MAIN LOGIC
+# SAMPLING
 # ---------------------------------------------------
-history = load_history()
-cpu_history = history.get('cpu', deque(maxlen=TOOLTIP_WIDTH))
-per_core_history = history.get('per_core', {})
-
-cpu_name = get_cpu_name()
-max_cpu_temp = 0
-
-# Temperature
-try:
-    temps = psutil.sensors_temperatures() or {}
-    # Try common labels
-    for label in ["k10temp", "coretemp", "zenpower"]:
-        if label in temps:
-            for t in temps[label]:
-                if t.current > max_cpu_temp:
-                    max_cpu_temp = int(t.current)
-except: pass
-
-# Frequency
-current_freq = max_freq = 0
-try:
-    cpu_info = psutil.cpu_freq(percpu=False)
-    if cpu_info:
-        current_freq = cpu_info.current or 0
-        max_freq = cpu_info.max or 0
-except: pass
-
-# Power (RAPL)
-cpu_power = 0.0
-rapl_path = get_rapl_path()
-if rapl_path:
-    try:
-        with open(rapl_path, "r") as f: energy1 = int(f.read().strip())
-        time.sleep(0.05)
-        with open(rapl_path, "r") as f: energy2 = int(f.read().strip())
+# Utilization and power are deltas of raw kernel counters against the
+# previous tick (same process in --stream mode, previous run otherwise),
+# so they cover the whole polling interval without sleeping.
+def new_state(counters):
+    """Everything that survives between two ticks."""
+    hw = boot_cached("cpu_hardware", discover_hardware, CACHE_VERSION)
+    cpufreq = hw["cpufreq"]
+    return {
+        "hw": hw,
+        # cur, max, governor and epp of every policy, read in one pass
+        "cpufreq_files": SysfsBatch([entry[key] for key in ("cur", "max", "governor", "epp") for entry in cpufreq]),
+        "topology": boot_cached("cpu_topology", read_topology, CACHE_VERSION),
+        "history": open_history(HISTORY_FILE, HISTORY_MAGIC, 1 + (os.cpu_count() or 1), HISTORY_LENGTH, "f"),
+        # Raw counters of the previous tick:
+        # stat   -> [(cpu, busy, total)] jiffies, cpu -1 is the aggregate line
+        # energy -> {zone id: energy in uJ}
+        # throttle -> {thermal_throttle file: count}
+        # procs  -> {(pid, starttime): utime + stime} in clock ticks
+        # ts     -> time.monotonic() (system wide, comparable across runs)
+        "counters": counters,
+        # {(pid, starttime): (name, hidden)}, only filled for top candidates
+        "proc_names": {},
+    }
 
-        delta = energy2 - energy1
+def read_proc_stat():
+    counters = []
+    with open(f"{PROC}/stat", "r") as f:
+        for line in f:
+            if not line.startswith("cpu"): break
+            name, *values = line.split()
+            # user nice system idle iowait irq softirq steal (guest is already in user)
+            fields = [int(x) for x in values[:8]]
+            total = sum(fields)
+            idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+            counters.append((int(name[3:]) if len(name) > 3 else -1, total - idle, total))
+    return counters
+
+def read_cpu_usage(state):
+    """Returns (total %, {cpu: %}) over the time since the previous tick."""
+    counters = state["counters"]
+    try: stat = read_proc_stat()
+    except: return 0.0, {}
+
+    try: prev = {cpu: (busy, total) for cpu, busy, total in counters.get("stat") or []}
+    except ValueError: prev = {}
+    counters["stat"] = stat
+
+    usage = {}
+    for cpu, busy, total in stat:
+        # First run or CPU hotplug: fall back to the average since boot
+        prev_busy, prev_total = prev.get(cpu, (0, 0))
+        d_total = total - prev_total
+        pct = 100.0 * (busy - prev_busy) / d_total if d_total > 0 else 0.0
+        usage[cpu] = round(min(100.0, max(0.0, pct)), 1)
+    return usage.pop(-1, 0.0), usage
+
+def read_energy(path):
+    with open(path, "r") as f: return int(f.read().strip())
+
+def read_power(state, now):
+    """Returns {zone id: watts} for every energy zone, in one pass."""
+    zones, counters = state["hw"]["energy_zones"], state["counters"]
+    energy = {}
+    for zone in zones:
+        try: energy[zone["id"]] = sum(read_energy(path) for path in zone["paths"])
+        except: pass
+
+    prev, prev_ts = counters.get("energy"), counters.get("ts")
+    counters["energy"] = energy
+    # Nothing to diff against yet (or the monotonic clock restarted with a reboot)
+    if not isinstance(prev, dict) or prev_ts is None or now <= prev_ts: return {}
+
+    watts = {}
+    for zone in zones:
+        zone_id = zone["id"]
+        if zone_id not in energy or zone_id not in prev: continue
+        delta = energy[zone_id] - prev[zone_id]
         # Handle overflow
         if delta < 0:
-            # Try to find max range
-            max_f = os.path.join(os.path.dirname(rapl_path), "max_energy_range_uj")
-            if os.path.exists(max_f):
-                with open(max_f, "r") as f: max_e = int(f.read().strip())
-                delta = (max_e + energy2) - energy1
-            else:
-                delta = (2**32 + energy2) - energy1
-
-        cpu_power = (delta / 1_000_000) / 0.05
-    except: pass
-
-cpu_percent = psutil.cpu_percent(interval=0.1)
-cpu_history.append(cpu_percent)
+            # hwmon accumulators don't wrap, a drop means the driver was reloaded
+            if zone["dir"] is None: continue
+            delta += zone["max_range"] or 2**32
+        watts[zone_id] = (delta / 1_000_000) / (now - prev_ts)
+    return watts
+
+def package_power(zones, watts):
+    """Sum of the package domains, their subzones and psys would count twice."""
+    top = [zone for zone in zones if zone["parent"] is None and zone["id"] in watts]
+    packages = [zone for zone in top if zone["name"].startswith("package")]
+    packages = packages or [zone for zone in top if zone["name"] not in ("psys", "cores")] or top
+    return sum(watts[zone["id"]] for zone in packages)
 
-# Per Core
-per_core = psutil.cpu_percent(interval=0.1, percpu=True)
-decay_factor = 0.95
-for i, usage in enumerate(per_core):
-    if i not in per_core_history:
-        per_core_history[i] = usage
+# ---------------------------------------------------
+# PROCESSES
+# ---------------------------------------------------
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+def describe_process(pid):
+    """Returns (name, hidden) for a pid, hidden processes belong to waybar."""
+    name = read_pid_stat(pid)[0].decode(errors="replace")
+    with open(f"{PROC}/{pid}/cmdline", "rb") as f: args = f.read()
+    return name, b"waybar" in args
+
+def scan_processes(state, now):
+    """
+    Reads utime+stime of every process from /proc/[pid]/stat and returns the
+    TOP_PROCESSES [(name, cpu%)] over the time elapsed since the previous tick.
+    Processes are identified by pid+starttime so a recycled pid isn't diffed
+    against its predecessor, and names are only resolved for top candidates.
+    """
+    counters, names = state["counters"], state["proc_names"]
+    prev, prev_ts = counters.get("procs"), counters.get("ts")
+    if prev is not None and prev_ts is not None and now > prev_ts:
+        elapsed_ticks = (now - prev_ts) * CLK_TCK
     else:
-        per_core_history[i] = (per_core_history[i] * decay_factor) + (usage * (1 - decay_factor))
+        # No previous scan: lifetime average, like ps
+        prev = None
+        with open(f"{PROC}/uptime", "r") as f: uptime_ticks = float(f.read().split()[0]) * CLK_TCK
+
+    current, heap = {}, []
+    for entry in os.listdir(PROC):
+        if not entry.isdigit(): continue
+        try: fields = read_pid_stat(entry)[1]
+        except OSError: continue
+        ticks = int(fields[11]) + int(fields[12])
+        key = (int(entry), int(fields[19]))
+        current[key] = ticks
+
+        if prev is not None:
+            # Processes started since the previous scan count from zero
+            usage = (ticks - prev.get(key, 0)) / elapsed_ticks * 100
+        else:
+            age = uptime_ticks - key[1]
+            usage = ticks / age * 100 if age > 0 else 0.0
+
+        # Bounded min-heap: anything not beating the current N-th is skipped
+        # before paying for its name and cmdline
+        if len(heap) == TOP_PROCESSES and usage <= heap[0][0]: continue
+        if key not in names:
+            try: names[key] = describe_process(entry)
+            except OSError: continue
+        name, hidden = names[key]
+        if hidden: continue
+        if len(heap) < TOP_PROCESSES: heapq.heappush(heap, (usage, key, name))
+        else: heapq.heapreplace(heap, (usage, key, name))
+
+    counters["procs"] = current
+    state["proc_names"] = {key: names[key] for key in names if key in current}
+    return [(name, usage) for usage, _, name in sorted(heap, reverse=True)]
+
+# ---------------------------------------------------
+# COLLECT
+# ---------------------------------------------------
+def read_cpu_temp(hw):
+    max_cpu_temp = 0
+    for path in hw["temp_inputs"]:
+        max_cpu_temp = max(max_cpu_temp, read_sysfs_int(path) // 1000)
+    return max_cpu_temp
+
+def read_cpufreq(state):
+    """
+    Returns ({cpu: (current, policy max, hardware max)} in kHz,
+    {governor: cpus}, {epp: cpus}). The policy max is None when
+    scaling_max_freq couldn't be read.
+    """
+    entries = state["hw"]["cpufreq"]
+    n = len(entries)
+    values = state["cpufreq_files"].read()
+    freqs, governors, epps = {}, {}, {}
+    for i, entry in enumerate(entries):
+        current, max_khz, governor, epp = values[i], values[n + i], values[2 * n + i], values[3 * n + i]
+        if current and current.isdigit():
+            freqs[entry["cpu"]] = (int(current), int(max_khz) if max_khz and max_khz.isdigit() else None, entry["hw_max"])
+        if governor: governors[governor] = governors.get(governor, 0) + 1
+        if epp: epps[epp] = epps.get(epp, 0) + 1
+    return freqs, governors, epps
+
+def cpu_clock(freqs):
+    """Returns (average current, highest max) in MHz, the hardware max standing in for an unreadable policy max."""
+    if freqs:
+        return sum(f[0] for f in freqs.values()) / len(freqs) / 1000, max(f[1] or f[2] for f in freqs.values()) / 1000
+
+    # No cpufreq driver (VMs): the kernel still reports a clock in /proc/cpuinfo
+    try:
+        with open(f"{PROC}/cpuinfo", "r") as f:
+            mhz = [float(line.split(":")[1]) for line in f if line.startswith("cpu MHz")]
+        return (sum(mhz) / len(mhz) if mhz else 0), 0
+    except: return 0, 0
+
+def read_throttling(state, per_core, freqs, power_domains):
+    """
+    Tallies what held the CPU back since the previous tick: thermal and
+    power-limit throttle events, clipped cores (policy max lowered below the
+    hardware max, or busy but well below the allowed max) and how close each
+    package runs to its RAPL power limits.
+    """
+    hw, counters = state["hw"], state["counters"]
+    counts = {}
+    for path in hw["throttle_counts"]:
+        count = read_sysfs_int(path, None)
+        if count is not None: counts[path] = count
+    prev = counters.get("throttle")
+    counters["throttle"] = counts
+
+    thermal = power = 0
+    if isinstance(prev, dict):
+        for path, count in counts.items():
+            # Counters only go up, a missing/lower one is a new file or a reset
+            delta = count - prev.get(path, count)
+            if delta <= 0: continue
+            if "power_limit" in path: power += delta
+            else: thermal += delta
+
+    clipped = 0
+    for cpu, (current, max_khz, hw_max) in freqs.items():
+        # Without the policy max there's nothing to compare against
+        if max_khz is None: continue
+        if (hw_max and max_khz < hw_max) or (per_core.get(cpu, 0.0) >= 50 and current < max_khz * CLIP_RATIO):
+            clipped += 1
+
+    limits = []
+    for zone in hw["energy_zones"]:
+        if zone["parent"] is not None or zone["id"] not in power_domains: continue
+        for limit in zone["limits"]:
+            limit_w = read_sysfs_int(limit["path"]) / 1_000_000
+            if limit_w > 0: limits.append((zone["name"], limit["name"], limit_w, power_domains[zone["id"]] / limit_w))
+
+    if thermal: cause = "thermal"
+    elif power or any(ratio >= LIMIT_RATIO for *_, ratio in limits): cause = "power limit"
+    elif clipped: cause = "frequency capped"
+    else: cause = "none"
+    return {"cause": cause, "thermal": thermal, "power": power, "clipped": clipped, "cores": len(freqs), "limits": limits}
+
+def collect(state):
+    hw = state["hw"]
+    max_cpu_temp = read_cpu_temp(hw)
+    freqs, governors, epps = read_cpufreq(state)
+    current_freq, max_freq = cpu_clock(freqs)
+
+    # Power (RAPL) and utilization, both over the time elapsed since the previous tick
+    now = time.monotonic()
+    power_domains = read_power(state, now)
+    cpu_power = package_power(hw["energy_zones"], power_domains)
+    cpu_percent, per_core = read_cpu_usage(state)
+    try: top_processes = scan_processes(state, now)
+    except: top_processes = []
+    throttling = read_throttling(state, per_core, freqs, power_domains)
+    state["counters"]["ts"] = now
+    history = state["history"]
+    if history:
+        try: history.append([cpu_percent, *(per_core.get(cpu, 0.0) for cpu in range(history.columns - 1))])
+        except: pass
+
+    return {
+        "max_cpu_temp": max_cpu_temp,
+        "current_freq": current_freq,
+        "max_freq": max_freq,
+        "freqs": freqs,
+        "governors": governors,
+        "epps": epps,
+        "cpu_power": cpu_power,
+        "power_domains": power_domains,
+        "throttling": throttling,
+        "cpu_percent": cpu_percent,
+        "per_core": per_core,
+        "top_processes": top_processes,
+    }
 
 def get_core_color(usage):
     if usage < 20: return "#81c8be"
@@ -195,96 +529,220 @@ def get_core_color(usage):
     elif usage < 95: return "#ea999c"
     else: return "#e78284"
 
+# ---------------------------------------------------
+# DIE VISUALIZATION
+# ---------------------------------------------------
+ROW_PATTERNS = [("┐", "┌"), ("│", "│"), ("┘", "└")]
+
+def render_die(cores, per_core, substrate_color, border_color, min_rows=1):
+    """Returns the lines of one die, cores are lists of SMT siblings."""
+    cols = 4 if len(cores) <= 24 else 8
+    width = 4 * cols + 5
+    if cols == 4:
+        top, bottom = "╭──┘└────┘⠿└─────┘└─╮", "╰──┐┌────┐⣶┌─────┐┌─╯"
+    else:
+        top = "╭" + ("──┘└" * width)[:width - 2] + "╮"
+        bottom = "╰" + ("──┐┌" * width)[:width - 2] + "╯"
+
+    substrate = f"<span foreground='{substrate_color}'>"
+    lines = [
+        f"<span foreground='{border_color}'>{top}</span>",
+        f"<span foreground='{border_color}'>┘</span>{substrate}{'░' * (width - 2)}</span><span foreground='{border_color}'>└</span>",
+    ]
+    for row in range(max(min_rows, math.ceil(len(cores) / cols))):
+        start_char, end_char = ROW_PATTERNS[row % len(ROW_PATTERNS)]
+        line_parts = [f"<span foreground='{border_color}'>{start_char}</span>{substrate}░░</span>"]
+        for col in range(cols):
+            core_idx = row * cols + col
+            if core_idx < len(cores):
+                # SMT siblings share one cell: colored by the busiest thread,
+                # half filled when only some of them are busy
+                usages = [per_core.get(cpu, 0.0) for cpu in cores[core_idx]]
+                busy = sum(1 for usage in usages if usage >= 10)
+                circle = "○" if not busy else "●" if busy == len(usages) else "◐"
+                line_parts.append(f"<span foreground='{border_color}'>[</span><span foreground='{get_core_color(max(usages))}'>{circle}</span><span foreground='{border_color}'>]</span>")
+            else:
+                line_parts.append(f"{substrate}░░░</span>")
+            if col < cols - 1: line_parts.append(f"{substrate}░</span>")
+        line_parts.append(f"{substrate}░░</span><span foreground='{border_color}'>{end_char}</span>")
+        lines.append("".join(line_parts))
+    lines.append(f"<span foreground='{border_color}'>┐</span>{substrate}{'░' * (width - 2)}</span><span foreground='{border_color}'>┌</span>")
+    lines.append(f"<span foreground='{border_color}'>{bottom}</span>")
+    return lines, width
+
+def render_dies(topology, per_core, substrate_color, max_line_len):
+    border_color = COLORS['white']
+    if not topology:
+        # No sysfs topology: one die, one core per logical CPU
+        topology = [{"package": 0, "die": 0, "cores": [[cpu] for cpu in sorted(per_core)]}]
+
+    lines = []
+    labelled = len(topology) > 1
+    # A lone die keeps the classic 6 row chip look
+    min_rows = 1 if labelled else 6
+    for start in range(0, len(topology), DIES_PER_ROW):
+        row = topology[start:start + DIES_PER_ROW]
+        rendered = [render_die(die["cores"], per_core, substrate_color, border_color, min_rows) for die in row]
+        row_width = sum(width for _, width in rendered) + len(rendered) - 1
+        padding = " " * max(0, (max_line_len - row_width) // 2)
+        height = max(len(die_lines) for die_lines, _ in rendered)
+        if labelled:
+            labels = [f"{'P%d · Die %d' % (die['package'], die['die']):^{width}}" for die, (_, width) in zip(row, rendered)]
+            lines.append(f"{padding}<span foreground='{border_color}'>{' '.join(labels)}</span>")
+        for i in range(height):
+            parts = [die_lines[i] if i < len(die_lines) else " " * width for die_lines, width in rendered]
+            lines.append(padding + " ".join(parts))
+    return lines
+
+# ---------------------------------------------------
+# CORE CLOCKS
+# ---------------------------------------------------
+FREQ_BARS = "▁▂▃▄▅▆▇█"
+
+def describe_policy(counts):
+    """Most common value, flagged when CPUs disagree."""
+    if not counts: return None
+    value = max(counts, key=counts.get)
+    return value if len(counts) == 1 else f"{value} (mixed)"
+
+def render_core_clocks(topology, sample, max_line_len):
+    """One bar per physical core in die order, height and color by clock vs hardware max."""
+    freqs = sample["freqs"]
+    cores = [core for die in topology for core in die["cores"]] or [[cpu] for cpu in sorted(freqs)]
+
+    bars, lowest, highest = [], None, 0
+    for siblings in cores:
+        core_freqs = [freqs[cpu] for cpu in siblings if cpu in freqs]
+        if not core_freqs: continue
+        current, max_khz, hw_max = max(core_freqs, key=lambda f: f[0])
+        ratio = current / (hw_max or max_khz or current)
+        lowest = current if lowest is None else min(lowest, current)
+        highest = max(highest, current)
+        bars.append((get_color(ratio * 100, 'cpu_freq'), FREQ_BARS[min(len(FREQ_BARS) - 1, int(ratio * len(FREQ_BARS)))]))
+
+    lines = [f"Core Clocks: {(lowest or 0) / 1_000_000:.2f} - {highest / 1_000_000:.2f} GHz"]
+    for start in range(0, len(bars), max_line_len - 1):
+        parts = []
+        # Neighbouring bars of the same color share one span
+        for color, bar in bars[start:start + max_line_len - 1]:
+            if parts and parts[-1][0] == color: parts[-1][1].append(bar)
+            else: parts.append((color, [bar]))
+        lines.append(" " + "".join(f"<span foreground='{color}'>{''.join(group)}</span>" for color, group in parts))
+
+    governor, epp = describe_policy(sample["governors"]), describe_policy(sample["epps"])
+    if governor: lines.append(f" • Governor: {governor}")
+    if epp: lines.append(f" • EPP: {epp}")
+    return lines
+
 # ---------------------------------------------------
 # TOOLTIP
 # ---------------------------------------------------
-tooltip_lines = []
-
-tooltip_lines.append(
-    f"<span foreground='{SECTION_COLORS['CPU']['icon']}'>{CPU_ICON_GENERAL}</span> "
-    f"<span foreground='{SECTION_COLORS['CPU']['text']}'>CPU</span> - {cpu_name}:"
-)
-
-cpu_rows = [
-    ("󱎫", f"Clock Speed: <span foreground='{get_color((current_freq/max_freq*100) if max_freq > 0 else 0, 'cpu_power')}'>{current_freq/1000:.2f} GHz</span> / {max_freq/1000:.2f} GHz"),
-    ("", f"Temperature: <span foreground='{get_color(max_cpu_temp,'cpu_gpu_temp')}'>{max_cpu_temp}°C</span>"),
-    ("", f"Power: <span foreground='{get_color(cpu_power,'cpu_power')}'>{cpu_power:.1f} W</span>"),
-    ("󰓅", f"Utilization: <span foreground='{get_color(cpu_percent,'cpu_power')}'>{cpu_percent:.0f}%</span>")
-]
+def render(state, sample):
+    max_cpu_temp = sample["max_cpu_temp"]
+    current_freq, max_freq = sample["current_freq"], sample["max_freq"]
+    cpu_power, cpu_percent = sample["cpu_power"], sample["cpu_percent"]
+    per_core = sample["per_core"]
+
+    tooltip_lines = []
+
+    tooltip_lines.append(
+        f"<span foreground='{SECTION_COLORS['CPU']['icon']}'>{CPU_ICON_GENERAL}</span> "
+        f"<span foreground='{SECTION_COLORS['CPU']['text']}'>CPU</span> - {state['hw']['cpu_name']}:"
+    )
+
+    cpu_rows = [
+        ("󱎫", f"Clock Speed: <span foreground='{get_color((current_freq/max_freq*100) if max_freq > 0 else 0, 'cpu_freq')}'>{current_freq/1000:.2f} GHz</span> / {max_freq/1000:.2f} GHz"),
+        ("", f"Temperature: <span foreground='{get_color(max_cpu_temp,'cpu_gpu_temp')}'>{max_cpu_temp}°C</span>"),
+        ("", f"Power: <span foreground='{get_color(cpu_power,'cpu_power')}'>{cpu_power:.1f} W</span>"),
+        ("󰓅", f"Utilization: <span foreground='{get_color(cpu_percent,'cpu_power')}'>{cpu_percent:.0f}%</span>")
+    ]
+
+    max_line_len = max(len(re.sub(r'<.*?>','',line_text)) for _, line_text in cpu_rows) + 5
+    max_line_len = max(max_line_len, 29)
+    tooltip_lines.append("─" * max_line_len)
+    for icon, text_row in cpu_rows:
+        tooltip_lines.append(f"{icon} | {text_row}")
+
+    # Power Domains (only worth it when there is more than one zone)
+    zones = [zone for zone in state["hw"]["energy_zones"] if zone["id"] in sample["power_domains"]]
+    if len(zones) > 1:
+        tooltip_lines.append("")
+        tooltip_lines.append("Power Domains:")
+        for i, zone in enumerate(zones):
+            watts = sample["power_domains"][zone["id"]]
+            if zone["parent"] is None:
+                prefix = " • "
+            else:
+                last = i + 1 == len(zones) or zones[i + 1]["parent"] != zone["parent"]
+                prefix = "   └ " if last else "   ├ "
+            label = f"{prefix}{zone['name']}"
+            tooltip_lines.append(f"{label:<17} <span foreground='{get_color(watts, 'cpu_power')}'>{watts:>6.1f} W</span>")
+
+    # Throttling
+    throttling = sample["throttling"]
+    hw = state["hw"]
+    if hw["throttle_counts"] or hw["cpufreq"] or throttling["limits"]:
+        cause_color = COLORS['green'] if throttling["cause"] == "none" else COLORS['red'] if throttling["cause"] == "thermal" else COLORS['yellow']
+        tooltip_lines.append("")
+        tooltip_lines.append(f"Throttling: <span foreground='{cause_color}'>{throttling['cause']}</span>")
+        if hw["throttle_counts"]:
+            tooltip_lines.append(f" • {'Thermal events':<16} {throttling['thermal']:>6}")
+            tooltip_lines.append(f" • {'Power events':<16} {throttling['power']:>6}")
+        if throttling["cores"]:
+            tooltip_lines.append(f" • {'Clipped cores':<16} {f'{throttling['clipped']}/{throttling['cores']}':>6}")
+        for zone_name, limit_name, limit_w, ratio in throttling["limits"]:
+            color = COLORS['red'] if ratio >= LIMIT_RATIO else COLORS['white']
+            tooltip_lines.append(f" • {zone_name} {limit_name}: {limit_w:.0f} W <span foreground='{color}'>({ratio * 100:.0f}%)</span>")
+
+    # CPU Die Visualization
+    substrate_color = get_color(max_cpu_temp, 'cpu_gpu_temp')
+    tooltip_lines.append("")
+    tooltip_lines.extend(render_dies(state["topology"], per_core, substrate_color, max_line_len))
+
+    # Core Clocks
+    if sample["freqs"]:
+        tooltip_lines.append("")
+        tooltip_lines.extend(render_core_clocks(state["topology"], sample, max_line_len))
+
+    # Top Processes
+    tooltip_lines.append("")
+    tooltip_lines.append("Top Current Processes:")
+    for name, usage in sample["top_processes"]:
+        if len(name) > 15: name = name[:14] + "…"
+        color = get_core_color(usage)
+        tooltip_lines.append(f" • {name:<15} <span foreground='{color}'> {usage:>5.1f}%</span>")
+
+    tooltip_lines.append("")
+    tooltip_lines.append(f"<span foreground='{COLORS['white']}'>{'┈' * max_line_len}</span>")
+    tooltip_lines.append("󰍽 LMB: Btop")
+
+    return {
+        "text": f"{CPU_ICON_GENERAL} <span foreground='{get_color(max_cpu_temp,'cpu_gpu_temp')}'>{max_cpu_temp}°C</span>",
+        "tooltip": f"<span size='14000'>{'\n'.join(tooltip_lines)}</span>",
+        "markup": "pango",
+        "class": "cpu",
+        "click-events": True
+    }
 
-max_line_len = max(len(re.sub(r'<.*?>','',line_text)) for _, line_text in cpu_rows) + 5
-max_line_len = max(max_line_len, 29)
-tooltip_lines.append("─" * max_line_len)
-for icon, text_row in cpu_rows:
-    tooltip_lines.append(f"{icon} | {text_row}")
-
-# CPU Die Visualization
-cpu_viz_width = 25
-center_padding = " " * int((max_line_len - cpu_viz_width) // 2)
-substrate_color = get_color(max_cpu_temp, 'cpu_gpu_temp')
-border_color = COLORS['white']
-
-tooltip_lines.append("")
-tooltip_lines.append(f"{center_padding}  <span foreground='{border_color}'>╭──┘└────┘⠿└─────┘└─╮</span>")
-tooltip_lines.append(f"{center_padding}  <span foreground='{border_color}'>┘</span><span foreground='{substrate_color}'>░░░░░░░░░░░░░░░░░░░</span><span foreground='{border_color}'>└</span>")
-
-# Grid layout for cores (adjust rows/cols based on core count if needed, fixed 6x4 here)
-row_patterns = [("┐", "┌"), ("│", "│"), ("┘", "└")] * 2
-for row in range(6):
-    start_char, end_char = row_patterns[row]
-    line_parts = [f"{center_padding}  <span foreground='{border_color}'>{start_char}</span><span foreground='{substrate_color}'>░░</span>"]
-    for col in range(4):
-        core_idx = row * 4 + col
-        if core_idx < len(per_core):
-            usage = per_core[core_idx]
-            color = get_core_color(usage)
-            circle = "●" if usage >= 10 else "○"
-            line_parts.append(f"<span foreground='{border_color}'>[</span><span foreground='{color}'>{circle}</span><span foreground='{border_color}'>]</span>")
-        else:
-            line_parts.append(f"<span foreground='{substrate_color}'>░░░</span>")
-        if col < 3: line_parts.append(f"<span foreground='{substrate_color}'>░</span>")
-    line_parts.append(f"<span foreground='{substrate_color}'>░░</span><span foreground='{border_color}'>{end_char}</span>")
-    tooltip_lines.append("".join(line_parts))
+# ---------------------------------------------------
+# MAIN LOGIC
+# ---------------------------------------------------
+def run_once():
+    state = new_state(load_counters(COUNTERS_FILE, COUNTER_TABLES))
+    output = render(state, collect(state))
+    save_counters(COUNTERS_FILE, state["counters"], COUNTER_TABLES)
 
-tooltip_lines.append(f"{center_padding}  <span foreground='{border_color}'>┐</span><span foreground='{substrate_color}'>░░░░░░░░░░░░░░░░░░░</span><span foreground='{border_color}'>┌</span>")
-tooltip_lines.append(f"{center_padding}  <span foreground='{border_color}'>╰──┐┌────┐⣶┌─────┐┌─╯</span>")
+    TERMINAL = os.environ.get("TERMINAL") or shutil.which("alacritty") or "xterm"
+    if os.environ.get("WAYBAR_CLICK_TYPE") == "left":
+        subprocess.Popen([TERMINAL, "-e", "btop"])
 
-# Top Processes
-tooltip_lines.append("")
-tooltip_lines.append("Top Current Processes:")
-try:
-    ps_cmd = ["ps", "-eo", "pcpu,comm,args", "--sort=-pcpu", "--no-headers"]
-    ps_output = subprocess.check_output(ps_cmd, text=True).strip()
-    count = 0
-    for line in ps_output.split('\n'):
-        if count >= 3: break
-        parts = line.strip().split(maxsplit=2)
-        if len(parts) >= 2:
-            try:
-                usage = float(parts[0])
-                name = parts[1]
-                if "waybar" in parts[2] if len(parts)>2 else "": continue
-                if len(name) > 15: name = name[:14] + "…"
-                color = get_core_color(usage)
-                tooltip_lines.append(f" • {name:<15} <span foreground='{color}'> {usage:>5.1f}%</span>")
-                count += 1
-            except: continue
-except: pass
-
-tooltip_lines.append("")
-tooltip_lines.append(f"<span foreground='{COLORS['white']}'>{'┈' * max_line_len}</span>")
-tooltip_lines.append("󰍽 LMB: Btop")
-
-save_history(cpu_history, per_core_history)
-
-TERMINAL = os.environ.get("TERMINAL") or shutil.which("alacritty") or "xterm"
-if os.environ.get("WAYBAR_CLICK_TYPE") == "left":
-    subprocess.Popen([TERMINAL, "-e", "btop"])
-
-print(json.dumps({
-    "text": f"{CPU_ICON_GENERAL} <span foreground='{get_color(max_cpu_temp,'cpu_gpu_temp')}'>{max_cpu_temp}°C</span>",
-    "tooltip": f"<span size='14000'>{'\n'.join(tooltip_lines)}</span>",
-    "markup": "pango",
-    "class": "cpu",
-    "click-events": True
-}))
+    print(json.dumps(output))
+
+def run_stream():
+    state = new_state({})
+    stream(lambda: render(state, collect(state)),
+           lambda elapsed: time.sleep(max(0.0, STREAM_INTERVAL - elapsed)))
+
+if __name__ == "__main__":
+    if "--stream" in sys.argv[1:]: run_stream()
+    else: run_once()
@@ -5,24 +5,90 @@
 # A dynamic memory monitor for Waybar.
 # Features:
 # - Real-time RAM usage with color-coded states
-# - Tooltip with detailed breakdown (Used, Cached, Buffers)
-# - Auto-detects memory modules via dmidecode (requires sudo permissions)
-# - Temperature monitoring (requires lm_sensors)
+# - Tooltip with detailed breakdown (Used, Shmem, Cached, Dirty, Slab,
+#   Buffers) plus hugepage, mlock, zswap and commit figures
+# - Auto-detects memory modules via dmidecode (requires sudo permissions),
+#   once per boot since DIMMs can't change without a reboot
+# - Temperature monitoring straight from the jc42/spd5118 hwmon nodes
+# - Memory pressure (PSI) averages, pushed on stalls in --stream mode
+# - Top memory consumers by PSS/USS (smaps_rollup)
+# - Swap paging rates and zram/zswap compression ratios
+# - Per-node bars and cross-node allocation rates on NUMA machines
+# - Optional fragmentation / transparent hugepage section
+# - Usage history sparkline and a time-to-exhaustion estimate from the
+#   MemAvailable trend
+#
+# Usage:
+#   memory.py            print a single JSON line and exit (waybar "interval")
+#   memory.py --stream   stay alive, refresh as soon as a PSI trigger fires
 # ----------------------------------------------------------------------------
 
 import json
-import psutil
 import subprocess
 import re
+import os
 import pathlib
+import glob
+import select
+import heapq
+import time
 import sys
 
+from common import PROC, SYS, STATE_DIR, boot_cached, load_counters, save_counters, open_history, read_pid_stat, stream
+
 # ---------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------
 MEM_ICON = ""
+PSI_ICON = "󰊚"
+TREND_ICON = "󰄪"
+ETA_ICON = "󰔟"
+SWAP_ICON = "󰓡"
+ZRAM_ICON = "󰗄"
+FRAG_ICON = "󰐱"
 TOOLTIP_WIDTH = 48
 
+CACHE_VERSION = 2  # bump when the layout of a boot cache changes
+DIMM_RETRY = 600  # seconds before an empty DIMM inventory or sensor list is looked up again
+
+COUNTERS_FILE = os.path.join(STATE_DIR, "waybar_memory_counters.json")
+COUNTER_TABLES = {"smaps": 3}  # {(pid, starttime): (rss, pss, uss)}
+HISTORY_FILE = os.path.join(STATE_DIR, "waybar_memory_history.bin")
+HISTORY_MAGIC = b"WMEM"
+HISTORY_COLUMNS = 4  # wall time, available, used, swap used (bytes)
+HISTORY_LENGTH = 2048  # samples kept in the history ring
+
+SPARK_WIDTH = 40       # sparkline characters
+SPARK_SPAN = 1800      # seconds covered by the sparkline
+TREND_WINDOW = 600     # seconds of history the MemAvailable trend is fitted on
+TREND_MIN_RATE = 1024**2 / 60  # bytes/s, slower drifts are shown as stable
+
+# Top memory consumers, ranked by "pss" (shared pages split between their
+# users) or "uss" (pages only this process maps)
+TOP_PROCESSES = 5
+TOP_METRIC = "pss"
+# smaps_rollup is only re-read once RSS moved by more than both of these
+RSS_DELTA_BYTES = 4 * 1024**2
+RSS_DELTA_RATIO = 0.05
+
+# /proc/vmstat counters shown as per-second rates
+VMSTAT_RATES = ["pswpin", "pswpout", "thp_fault_alloc", "thp_fault_fallback", "compact_stall"]
+# Per-node numastat counters shown as per-second rates
+NUMA_RATES = ["numa_hit", "numa_miss", "numa_foreign"]
+NODE_BAR_WIDTH = 24
+
+# Free blocks per order, THP policy and compaction activity
+SHOW_FRAGMENTATION = True
+
+# hwmon drivers of DIMM temperature sensors (DDR4 TSOD / DDR5 SPD hub)
+DIMM_SENSORS = ["jc42", "spd5118"]
+
+# --stream: PSI triggers as "<some|full> <stall us> <window us>", the window
+# must be a multiple of 2 s for unprivileged users
+PSI_TRIGGERS = ["some 300000 2000000", "full 100000 2000000"]
+STREAM_INTERVAL = 5   # refresh period when triggers are unavailable
+IDLE_INTERVAL = 30    # refresh period between stalls when they are
+
 # ---------------------------------------------------
 # THEME & COLORS
 # ---------------------------------------------------
@@ -67,13 +133,13 @@ SECTION_COLORS = {
 
 # Color thresholds for metrics
 COLOR_TABLE = [
-    {"color": COLORS["blue"],           "mem_storage": (0.0, 10), "mem_temp": (0, 40)},
-    {"color": COLORS["cyan"],           "mem_storage": (10.0, 20), "mem_temp": (41, 50)},
-    {"color": COLORS["green"],          "mem_storage": (20.0, 40), "mem_temp": (51, 60)},
-    {"color": COLORS["yellow"],         "mem_storage": (40.0, 60), "mem_temp": (61, 70)},
-    {"color": COLORS["bright_yellow"],  "mem_storage": (60.0, 80), "mem_temp": (71, 75)},
-    {"color": COLORS["bright_red"],     "mem_storage": (80.0, 90), "mem_temp": (76, 80)},
-    {"color": COLORS["red"],            "mem_storage": (90.0,100), "mem_temp": (81, 999)}
+    {"color": COLORS["blue"],           "mem_storage": (0.0, 10), "mem_temp": (0, 40),   "mem_psi": (0.0, 1),    "mem_swap_rate": (0.0, 0.1)},
+    {"color": COLORS["cyan"],           "mem_storage": (10.0, 20), "mem_temp": (41, 50),  "mem_psi": (1.0, 5),    "mem_swap_rate": (0.1, 1)},
+    {"color": COLORS["green"],          "mem_storage": (20.0, 40), "mem_temp": (51, 60),  "mem_psi": (5.0, 10),   "mem_swap_rate": (1.0, 5)},
+    {"color": COLORS["yellow"],         "mem_storage": (40.0, 60), "mem_temp": (61, 70),  "mem_psi": (10.0, 20),  "mem_swap_rate": (5.0, 10)},
+    {"color": COLORS["bright_yellow"],  "mem_storage": (60.0, 80), "mem_temp": (71, 75),  "mem_psi": (20.0, 40),  "mem_swap_rate": (10.0, 25)},
+    {"color": COLORS["bright_red"],     "mem_storage": (80.0, 90), "mem_temp": (76, 80),  "mem_psi": (40.0, 60),  "mem_swap_rate": (25.0, 50)},
+    {"color": COLORS["red"],            "mem_storage": (90.0,100), "mem_temp": (81, 999), "mem_psi": (60.0, 100), "mem_swap_rate": (50.0, 1e9)}
 ]
 
 def get_color(value, metric_type):
@@ -92,46 +158,70 @@ def get_color(value, metric_type):
 # ---------------------------------------------------
 # HARDWARE DETECTION
 # ---------------------------------------------------
-def get_memory_temps():
+def get_dimm_sensors():
     """
-    Reads memory temperatures from lm_sensors.
-    Requires: lm_sensors installed and sensors-detect run.
+    Finds the DIMM temperature hwmon nodes and the slot each one sits in.
+    The sensors answer on the SMBus at 0x18-0x1f (jc42) or 0x50-0x57
+    (spd5118), the low 3 bits being the slot on that bus; a second bus
+    (or mux segment) holds the next 8 slots.
     """
-    temps = []
-    try:
-        output = subprocess.check_output(["sensors", "-j"], text=True, stderr=subprocess.DEVNULL)
-        data = json.loads(output)
-        for chip, content in data.items():
-            if any(x in chip for x in ["jc42", "spd", "dram"]):
-                for feature, subfeatures in content.items():
-                    if isinstance(subfeatures, dict):
-                        for key, val in subfeatures.items():
-                            if "input" in key:
-                                temps.append(int(val))
-    except Exception:
-        pass
+    found = []
+    for name_file in sorted(glob.glob(f"{SYS}/class/hwmon/hwmon*/name")):
+        try:
+            with open(name_file, "r") as f: name = f.read().strip()
+        except OSError: continue
+        if name not in DIMM_SENSORS: continue
+
+        hwmon_dir = os.path.dirname(name_file)
+        paths = sorted(glob.glob(f"{hwmon_dir}/temp*_input"))
+        if not paths: continue
+        # device -> .../i2c-<bus>/<bus>-<addr>
+        try:
+            bus, addr = os.path.basename(os.readlink(f"{hwmon_dir}/device")).split("-")
+            found.append((int(bus), int(addr, 16), paths))
+        except (OSError, ValueError):
+            found.append((None, None, paths))
+
+    buses = sorted({bus for bus, _, _ in found if bus is not None})
+    sensors = []
+    for i, (bus, addr, paths) in enumerate(sorted(found, key=lambda s: (s[0] is None, s[0] or 0, s[1] or 0))):
+        # No bus address (unusual driver binding): fall back to discovery order
+        slot = buses.index(bus) * 8 + (addr & 0x7) if bus is not None else i
+        sensors.append({"slot": slot, "paths": paths})
+    return sensors
+
+def get_memory_temps(sensors):
+    """Returns {slot: °C}, the hottest input of each sensor."""
+    temps = {}
+    for sensor in sensors:
+        for path in sensor["paths"]:
+            try:
+                with open(path, "r") as f: value = int(f.read()) // 1000
+            except (OSError, ValueError): continue
+            temps[sensor["slot"]] = max(temps.get(sensor["slot"], 0), value)
     return temps
 
 def get_memory_modules_from_dmidecode():
     """
-    Fetches RAM stick details.
+    Fetches RAM stick details (locator, size, type, speed) and the slot
+    index, counting empty slots, which is what the SMBus address encodes.
     NOTE: Requires sudo permissions for dmidecode without password.
     Add this to sudoers: user ALL=(root) NOPASSWD: /usr/sbin/dmidecode
     """
     detected_modules = []
-    real_temps = get_memory_temps()
     try:
         output = subprocess.check_output(["sudo", "/usr/sbin/dmidecode", "--type", "memory"], text=True, stderr=subprocess.PIPE)
 
         current_module = {}
+        slot = 0
         for line in output.splitlines():
             line = line.strip()
             if line.startswith("Memory Device"):
                 if current_module and current_module.get("size") and current_module["size"] != "No Module Installed":
                     detected_modules.append(current_module)
 
-                t_val = real_temps[len(detected_modules)] if len(detected_modules) < len(real_temps) else 0
-                current_module = {"temp": t_val}
+                current_module = {"label": "DIMM", "slot": slot}
+                slot += 1
             elif current_module:
                 if line.startswith("Locator:"):
                     current_module["label"] = line.split(":", 1)[1].strip()
@@ -166,130 +256,661 @@ def get_memory_modules_from_dmidecode():
 
     return detected_modules
 
+def get_memory_modules(state):
+    """DIMM inventory with fresh temperatures matched by slot."""
+    if not state["modules"]:
+        # Loaded on first use and looked up again while empty, --stream
+        # outlives the retry window of a failed dmidecode
+        state["modules"] = boot_cached("memory_dimms", get_memory_modules_from_dmidecode, CACHE_VERSION, DIMM_RETRY)
+    if not state["sensors"]:
+        # Same for the sensor nodes, jc42/spd5118 may only be bound after login
+        state["sensors"] = boot_cached("memory_dimm_sensors", get_dimm_sensors, CACHE_VERSION, DIMM_RETRY)
+    temps = get_memory_temps(state["sensors"])
+    return [{**mod, "temp": temps.get(mod["slot"], 0)} for mod in state["modules"]]
+
 # ---------------------------------------------------
-# MAIN LOGIC
+# MEMINFO
 # ---------------------------------------------------
-mem = psutil.virtual_memory()
-mem_used_gb = mem.used / (1024**3)
-mem_total_gb = mem.total / (1024**3)
-mem_percent = mem.percent
-mem_available_gb = mem.available / (1024**3)
-mem_cached_gb = mem.cached / (1024**3) if hasattr(mem, 'cached') else 0
-mem_buffers_gb = mem.buffers / (1024**3) if hasattr(mem, 'buffers') else 0
-
-tooltip_lines = []
-
-# Header
-tooltip_lines.append(
-    f"<span foreground='{SECTION_COLORS['Memory']['icon']}'>{MEM_ICON}</span> "
-    f"<span foreground='{SECTION_COLORS['Memory']['text']}'>Memory</span>"
-)
-tooltip_lines.append("─" * TOOLTIP_WIDTH)
-tooltip_lines.append(f"󰓅 | Usage: <span foreground='{get_color(mem_percent,'mem_storage')}'>{mem_used_gb:.0f} GB</span> used / {mem_total_gb:.0f} GB Total")
-
-memory_modules = get_memory_modules_from_dmidecode()
-max_line_len = TOOLTIP_WIDTH
-
-# Module Table
-if memory_modules:
-    rows = []
-    for mod in memory_modules:
-        t_val = mod.get('temp', 0)
-        rows.append({
-            "icon": MEM_ICON,
-            "label": mod.get("label", "DIMM"),
-            "size": mod.get("size", "N/A"),
-            "speed": mod.get("speed", "N/A"),
-            "type": mod.get("type", "DDR4"),
-            "temp_text": f"{t_val}°C",
-            "temp_val": t_val
+# /proc/meminfo is ~1.5 KB, one read into a preallocated buffer is enough
+MEMINFO_BUFFER = bytearray(8192)
+
+def read_meminfo():
+    """Returns {field: bytes} (page counts for the HugePages_* fields)."""
+    fd = os.open(f"{PROC}/meminfo", os.O_RDONLY)
+    try: n = os.readv(fd, [MEMINFO_BUFFER])
+    finally: os.close(fd)
+
+    info = {}
+    for line in MEMINFO_BUFFER[:n].splitlines():
+        key, _, rest = line.partition(b":")
+        fields = rest.split()
+        if not fields: continue
+        info[key.decode()] = int(fields[0]) * 1024 if len(fields) > 1 else int(fields[0])
+    return info
+
+# /proc/vmstat is 5-10 KB and, unlike meminfo, a seq_file handing out at
+# most a page per read(): keep reading into the buffer until EOF
+VMSTAT_BUFFER = bytearray(16384)
+
+def read_vmstat():
+    global VMSTAT_BUFFER
+    fd = os.open(f"{PROC}/vmstat", os.O_RDONLY)
+    try:
+        n = 0
+        while True:
+            if n == len(VMSTAT_BUFFER): VMSTAT_BUFFER += bytearray(len(VMSTAT_BUFFER))
+            read = os.readv(fd, [memoryview(VMSTAT_BUFFER)[n:]])
+            if not read: break
+            n += read
+    finally: os.close(fd)
+
+    vmstat = {}
+    for line in VMSTAT_BUFFER[:n].splitlines():
+        key, _, value = line.partition(b" ")
+        vmstat[key.decode()] = int(value)
+    return vmstat
+
+def read_rates(state, totals, now):
+    """
+    Per-second deltas of the {name: counter} totals against the previous
+    tick (same process in --stream mode, previous run otherwise), {} on the
+    first one.
+    """
+    counters = state["counters"]
+    prev, prev_ts = counters.get("totals"), counters.get("ts")
+    counters["totals"], counters["ts"] = totals, now
+    if not prev or prev_ts is None or now <= prev_ts: return {}
+    # The counters restart from zero on reboot
+    return {key: max(0, value - prev.get(key, value)) / (now - prev_ts) for key, value in totals.items()}
+
+def read_numa():
+    """
+    {node: ({meminfo field: bytes}, {numastat field: pages})} for every
+    online node, from /sys/devices/system/node/node*/{meminfo,numastat}.
+    """
+    nodes = {}
+    for node_dir in glob.glob(f"{SYS}/devices/system/node/node[0-9]*"):
+        meminfo, numastat = {}, {}
+        try:
+            # "Node 0 MemTotal:       32768 kB"
+            with open(f"{node_dir}/meminfo", "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 4: meminfo[fields[2].rstrip(":")] = int(fields[3]) * (1024 if len(fields) > 4 else 1)
+            with open(f"{node_dir}/numastat", "r") as f:
+                for line in f:
+                    key, value = line.split()
+                    numastat[key] = int(value)
+        except (OSError, ValueError): continue
+        nodes[os.path.basename(node_dir)] = (meminfo, numastat)
+    return dict(sorted(nodes.items(), key=lambda item: int(item[0][4:])))
+
+def read_buddyinfo():
+    """Free blocks per order, summed over every node and zone."""
+    orders = []
+    try:
+        # "Node 0, zone   Normal   2577    357    146 ..."
+        with open(f"{PROC}/buddyinfo", "r") as f:
+            for line in f:
+                counts = [int(v) for v in line.split()[4:]]
+                orders.extend([0] * (len(counts) - len(orders)))
+                for order, count in enumerate(counts): orders[order] += count
+    except (OSError, ValueError): pass
+    return orders
+
+def read_thp_setting(name):
+    """Selected value of a transparent_hugepage knob ("always [madvise] never")."""
+    try:
+        with open(f"{SYS}/kernel/mm/transparent_hugepage/{name}", "r") as f: match = re.search(r"\[([^\]]+)\]", f.read())
+        return match.group(1) if match else None
+    except OSError: return None
+
+def unusable_index(orders, order):
+    """
+    Share of free memory in blocks smaller than 2^order pages, i.e. free
+    but useless for an allocation of that order without compaction.
+    """
+    free = sum(count << i for i, count in enumerate(orders))
+    if not free: return 0.0
+    usable = sum(count << i for i, count in enumerate(orders) if i >= order)
+    return (free - usable) / free * 100
+
+def read_zram():
+    """Initialised zram devices with their original/compressed/RAM sizes."""
+    devices = []
+    for mm_stat in sorted(glob.glob(f"{SYS}/block/zram*/mm_stat")):
+        # orig_data_size compr_data_size mem_used_total mem_limit ...
+        try:
+            with open(mm_stat, "r") as f: fields = [int(v) for v in f.read().split()]
+        except (OSError, ValueError): continue
+        if len(fields) < 3 or not fields[0]: continue
+
+        # failed_reads failed_writes invalid_io notify_free
+        failed = 0
+        try:
+            with open(os.path.join(os.path.dirname(mm_stat), "io_stat"), "r") as f: io = [int(v) for v in f.read().split()]
+            failed = io[0] + io[1]
+        except (OSError, ValueError, IndexError): pass
+        devices.append({
+            "name": os.path.basename(os.path.dirname(mm_stat)),
+            "orig": fields[0], "compr": fields[1], "used": fields[2], "failed": failed,
         })
+    return devices
 
-    # Calculate column widths
-    w_label = max(len(r["label"]) for r in rows)
-    w_size = max(len(r["size"]) for r in rows)
-    w_speed = max(len(r["speed"]) for r in rows)
-    w_type = max(len(r["type"]) for r in rows)
-    w_temp = max(len(r["temp_text"]) for r in rows)
+def format_bytes(value):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if value < 1024 or unit == "GB": break
+        value /= 1024
+    return f"{value:.0f} {unit}" if unit in ("B", "KB") or value >= 100 else f"{value:.1f} {unit}"
 
-    tooltip_lines.append("")
-    for r in rows:
-        temp_colored = f"<span foreground='{get_color(r['temp_val'], 'mem_temp')}'>{r['temp_text']:>{w_temp}}</span>"
-        line = (
-            f"{r['icon']} | "
-            f"{r['label']:<{w_label}} | "
-            f"{r['size']:<{w_size}} | "
-            f"{r['type']:<{w_type}} | "
-            f"{r['speed']:<{w_speed}} | "
-            f"{temp_colored}"
-        )
-        tooltip_lines.append(line)
+# ---------------------------------------------------
+# PROCESSES
+# ---------------------------------------------------
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def read_smaps_rollup(pid):
+    """Returns (pss, uss) in bytes."""
+    with open(f"{PROC}/{pid}/smaps_rollup", "rb") as f: raw = f.read()
+    values = {}
+    # First line is the [rollup] pseudo-mapping header
+    for line in raw.splitlines()[1:]:
+        key, _, rest = line.partition(b":")
+        values[key] = int(rest.split()[0]) * 1024
+    uss = values.get(b"Private_Clean", 0) + values.get(b"Private_Dirty", 0) + values.get(b"Private_Hugetlb", 0)
+    return values[b"Pss"], uss
+
+def scan_processes(state):
+    """
+    Returns the TOP_PROCESSES [(name, pss, uss)] ranked by TOP_METRIC.
+    RSS comes from /proc/[pid]/stat, which is read anyway for the start time
+    and name. smaps_rollup walks every mapping, so it is only read for pids
+    whose RSS moved past the thresholds since their cached (pid+starttime)
+    reading, and only while they can still make the top: PSS and USS never
+    exceed RSS, so walking by descending RSS stops at the N-th best value.
+    """
+    procs = []
+    for entry in os.listdir(PROC):
+        if not entry.isdigit(): continue
+        try: comm, fields = read_pid_stat(entry)
+        except OSError: continue
+        rss = int(fields[21])
+        # Kernel threads have no mm
+        if not rss: continue
+        name = comm.decode(errors="replace")
+        procs.append((rss, int(entry), int(fields[19]), name))
+    procs.sort(reverse=True)
+
+    cache, heap = state["counters"].get("smaps", {}), []
+    for rss, pid, start, name in procs:
+        if len(heap) == TOP_PROCESSES and rss * PAGE_SIZE <= heap[0][0]: break
+        key = (pid, start)
+        cached = cache.get(key)
+        if cached is None or abs(rss - cached[0]) * PAGE_SIZE > max(RSS_DELTA_BYTES, cached[0] * PAGE_SIZE * RSS_DELTA_RATIO):
+            # Other users' processes aren't readable, remember that too
+            try: cached = (rss, *read_smaps_rollup(pid))
+            except (OSError, KeyError, ValueError, IndexError): cached = (rss, None, None)
+            cache[key] = cached
+        if cached[1] is None: continue
+
+        value = cached[1] if TOP_METRIC == "pss" else cached[2]
+        if len(heap) < TOP_PROCESSES: heapq.heappush(heap, (value, key, name, cached))
+        elif value > heap[0][0]: heapq.heapreplace(heap, (value, key, name, cached))
+
+    alive = {(pid, start) for _, pid, start, _ in procs}
+    state["counters"]["smaps"] = {key: entry for key, entry in cache.items() if key in alive}
+    return [(name, entry[1], entry[2]) for _, _, name, entry in sorted(heap, reverse=True)]
 
-tooltip_lines.append("")
+# ---------------------------------------------------
+# HISTORY
+# ---------------------------------------------------
+def available_trend(rows):
+    """
+    Least-squares slope of MemAvailable in bytes/s over rows, None until
+    the samples span at least a tenth of TREND_WINDOW.
+    """
+    if len(rows) < 3 or rows[-1][0] - rows[0][0] < TREND_WINDOW / 10: return None
+    n = len(rows)
+    mean_t = sum(row[0] for row in rows) / n
+    mean_a = sum(row[1] for row in rows) / n
+    var_t = sum((row[0] - mean_t) ** 2 for row in rows)
+    if not var_t: return None
+    return sum((row[0] - mean_t) * (row[1] - mean_a) for row in rows) / var_t
 
-# Calculate max temp for connectors
-max_mem_temp = 0
-if memory_modules:
-    max_mem_temp = max(m.get('temp', 0) for m in memory_modules)
+# ---------------------------------------------------
+# PRESSURE STALL INFORMATION
+# ---------------------------------------------------
+def read_psi():
+    """Returns {"some": (avg10, avg60, avg300), "full": (...)}, {} without PSI."""
+    psi = {}
+    try:
+        with open(f"{PROC}/pressure/memory", "r") as f:
+            for line in f:
+                kind, *fields = line.split()
+                values = dict(field.split("=") for field in fields)
+                psi[kind] = tuple(float(values[key]) for key in ("avg10", "avg60", "avg300"))
+    except (OSError, KeyError, ValueError):
+        pass
+    return psi
 
-connector_color = get_color(max_mem_temp, 'mem_temp')
-frame_color = COLORS['white']
+def open_psi_triggers():
+    """
+    Registers PSI_TRIGGERS, one fd each since the kernel allows a single
+    trigger per open file. Returns [] when PSI is missing or the kernel
+    refuses unprivileged triggers (before 6.5, or a window that isn't a
+    multiple of 2 s).
+    """
+    # A fixture tree's pressure/memory is a plain file, writing a trigger
+    # would overwrite it
+    if PROC != "/proc": return []
+    fds = []
+    for trigger in PSI_TRIGGERS:
+        try:
+            fd = os.open(f"{PROC}/pressure/memory", os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            break
+        try:
+            os.write(fd, trigger.encode() + b"\0")
+            fds.append(fd)
+        except OSError:
+            os.close(fd)
+    return fds
 
-# Calculate percentages
-used_pct = (mem.used / mem.total) * 100
-cached_pct = (mem.cached / mem.total) * 100 if hasattr(mem, 'cached') else 0
-buffers_pct = (mem.buffers / mem.total) * 100 if hasattr(mem, 'buffers') else 0
-free_pct = max(0, 100.0 - used_pct - cached_pct - buffers_pct)
+# ---------------------------------------------------
+# COLLECT
+# ---------------------------------------------------
+def new_state(counters):
+    # DIMM inventory and sensor nodes come from the boot cache, loaded on
+    # first use. An empty result is only kept for DIMM_RETRY, so a missing
+    # sudo rule or an unbound sensor isn't retried every tick but isn't
+    # pinned for the boot either
+    return {
+        "modules": None,
+        "sensors": None,
+        "counters": counters,
+        "history": open_history(HISTORY_FILE, HISTORY_MAGIC, HISTORY_COLUMNS, HISTORY_LENGTH),
+    }
 
-# Graphic Dimensions
-graph_width = max_line_len - 2
-inner_width = graph_width - 4
-bar_len = inner_width - 2
-padding = " " * int((max_line_len - graph_width) // 2)
+def collect(state):
+    meminfo = read_meminfo()
+    # Wall clock rather than monotonic: the ring outlives this process, and a
+    # suspend gap is time during which memory genuinely didn't move
+    now = time.time()
+    total = meminfo["MemTotal"]
+    available = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+    swap_used = meminfo.get("SwapTotal", 0) - meminfo.get("SwapFree", 0)
+    vmstat = read_vmstat()
+    numa = read_numa()
+    # A counter the kernel doesn't have (no THP, no compaction) gets no rate
+    # rather than a misleading 0/s
+    totals = {key: vmstat[key] for key in VMSTAT_RATES if key in vmstat}
+    for node, (_, numastat) in numa.items():
+        totals.update({f"{node}/{key}": numastat.get(key, 0) for key in NUMA_RATES})
+    rates = read_rates(state, totals, time.monotonic())
+    rows = []
+    history = state["history"]
+    if history:
+        try:
+            history.append([now, available, total - available, swap_used])
+            rows = history.since(now - max(SPARK_SPAN, TREND_WINDOW))
+        except: pass
+
+    return {
+        "meminfo": meminfo,
+        "modules": get_memory_modules(state),
+        "psi": read_psi(),
+        "top_processes": scan_processes(state),
+        "now": now,
+        "history": rows,
+        "rates": rates,
+        "zram": read_zram(),
+        "numa": numa,
+        "buddyinfo": read_buddyinfo() if SHOW_FRAGMENTATION else None,
+        "thp": {name: read_thp_setting(name) for name in ("enabled", "defrag")} if SHOW_FRAGMENTATION else None,
+    }
 
 def c(text, color):
     return f"<span foreground='{color}'>{text}</span>"
 
-# Line 1
-tooltip_lines.append(f"{padding} {c('╭' + '─'*inner_width + '╮', frame_color)}")
-# Line 2
-tooltip_lines.append(f"{padding}{c('╭╯', frame_color)}{c('░'*inner_width, connector_color)}{c('╰╮', frame_color)}")
-# Line 3 (Bar)
-c_used = int((used_pct / 100.0) * bar_len)
-c_cached = int((cached_pct / 100.0) * bar_len)
-c_buffers = int((buffers_pct / 100.0) * bar_len)
-c_free = bar_len - c_used - c_cached - c_buffers
-if c_free < 0: c_free = 0
-
-bar_str = (
-    f"<span foreground='{COLORS['red']}'>{'█' * c_used}</span>"
-    f"<span foreground='{COLORS['yellow']}'>{'█' * c_cached}</span>"
-    f"<span foreground='{COLORS['cyan']}'>{'█' * c_buffers}</span>"
-    f"<span foreground='{COLORS['bright_black']}'>{'█' * c_free}</span>"
-)
-tooltip_lines.append(f"{padding}{c('╰╮', frame_color)}{c('░', connector_color)}{bar_str}{c('░', connector_color)}{c('╭╯', frame_color)}")
-# Line 4
-tooltip_lines.append(f"{padding} {c('│', frame_color)}{c('░'*inner_width, connector_color)}{c('│', frame_color)}")
-# Line 5
-tooltip_lines.append(f"{padding}{c('╭╯', frame_color)}{c('┌' + '┬'*bar_len + '┐', frame_color)}{c('╰╮', frame_color)}")
-# Line 6
-tooltip_lines.append(f"{padding}{c('└─', frame_color)}{c('┴'*inner_width, frame_color)}{c('─┘', frame_color)}")
-
-tooltip_lines.append("─" * max_line_len)
-
-legend = (
-    f"<span size='11000'>"
-    f"<span foreground='{COLORS['red']}'>█</span> Used {used_pct:.1f}%  "
-    f"<span foreground='{COLORS['yellow']}'>█</span> Cached {cached_pct:.1f}%  "
-    f"<span foreground='{COLORS['cyan']}'>█</span> Buffers {buffers_pct:.1f}%  "
-    f"<span foreground='{COLORS['bright_black']}'>█</span> Free {free_pct:.1f}%"
-    f"</span>"
-)
-tooltip_lines.append(legend)
-
-print(json.dumps({
-    "text": f"{MEM_ICON} <span foreground='{get_color(mem_percent,'mem_storage')}'>{mem_percent}%</span>",
-    "tooltip": f"<span size='14000'>{'\n'.join(tooltip_lines)}</span>",
-    "markup": "pango",
-    "class": "memory",
-}))
+def format_duration(seconds):
+    if seconds < 3600: return f"{seconds / 60:.0f} min"
+    if seconds < 86400: return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} days"
+
+# ---------------------------------------------------
+# TREND
+# ---------------------------------------------------
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+def render_sparkline(rows, now, total):
+    """Used memory over the last SPARK_SPAN seconds, the peak of each slot."""
+    slot_span = SPARK_SPAN / SPARK_WIDTH
+    slots = [None] * SPARK_WIDTH
+    for t, _, used, _ in rows:
+        i = min(SPARK_WIDTH - 1, int((t - (now - SPARK_SPAN)) / slot_span))
+        if i >= 0: slots[i] = max(slots[i] or 0.0, used / total)
+
+    spark = ""
+    for value in slots:
+        if value is None: spark += " "
+        else: spark += c(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(value * len(SPARK_CHARS)))], get_color(value * 100, "mem_storage"))
+    return spark
+
+def render_trend(rows, now, available, total):
+    """Sparkline and MemAvailable trend lines."""
+    if not rows: return []
+    lines = [f"{TREND_ICON} | {render_sparkline(rows, now, total)} {SPARK_SPAN // 60} min"]
+
+    slope = available_trend([row for row in rows if row[0] >= now - TREND_WINDOW])
+    if slope is None: return lines
+    rate = f"{'+' if slope > 0 else '-'}{format_bytes(abs(slope) * 60)}/min"
+    if slope > -TREND_MIN_RATE:
+        lines.append(f"{ETA_ICON} | Available: stable ({rate})")
+    else:
+        eta = available / -slope
+        color = COLORS["red"] if eta < 900 else COLORS["yellow"] if eta < 3600 else COLORS["white"]
+        lines.append(f"{ETA_ICON} | Available: {rate}, gone in {c(f'~{format_duration(eta)}', color)}")
+    return lines
+
+# ---------------------------------------------------
+# NUMA
+# ---------------------------------------------------
+def format_rate(value):
+    return f"{value / 1000:.1f}k/s" if value >= 1000 else f"{value:.0f}/s"
+
+def render_numa(numa, rates):
+    """
+    One bar per node (used, page cache + reclaimable slab, free) and the
+    rate of allocations that landed off-node: numa_miss counts pages this
+    node had to take for others, numa_foreign pages meant for it that went
+    elsewhere.
+    """
+    lines = []
+    w_name = max(len(node) for node in numa)
+    for node, (meminfo, _) in numa.items():
+        total = meminfo.get("MemTotal", 0)
+        if not total: continue
+        free = meminfo.get("MemFree", 0)
+        cached = meminfo.get("FilePages", 0) + meminfo.get("SReclaimable", 0)
+        used = max(0, total - free - cached)
+        pct = (total - free) / total * 100
+
+        c_used = int(used / total * NODE_BAR_WIDTH)
+        c_cached = min(NODE_BAR_WIDTH - c_used, int(cached / total * NODE_BAR_WIDTH))
+        bar = (
+            c('█' * c_used, COLORS['red']) + c('█' * c_cached, COLORS['yellow'])
+            + c('█' * (NODE_BAR_WIDTH - c_used - c_cached), COLORS['bright_black'])
+        )
+        lines.append(f"{node:<{w_name}} {bar} {c(f'{pct:>3.0f}%', get_color(pct, 'mem_storage'))} {format_bytes(free)} free")
+
+        if f"{node}/numa_hit" in rates:
+            hit, miss, foreign = (rates[f"{node}/{key}"] for key in NUMA_RATES)
+            # Share of this node's allocations that had to cross nodes
+            off_node = miss / (hit + miss) * 100 if hit + miss else 0
+            lines.append(
+                f"{'':<{w_name}} miss {c(format_rate(miss), get_color(off_node, 'mem_storage'))}"
+                f"  foreign {format_rate(foreign)}"
+            )
+    return lines
+
+# ---------------------------------------------------
+# FRAGMENTATION
+# ---------------------------------------------------
+def render_fragmentation(orders, thp, rates, meminfo):
+    """
+    Free memory per buddy order as a sparkline, the share of it too
+    fragmented for a huge page, THP fault fallbacks and compaction stalls.
+    """
+    huge_size = meminfo.get("Hugepagesize", 2 * 1024**2)
+    huge_order = max(0, (huge_size // PAGE_SIZE).bit_length() - 1)
+
+    free = [count << i for i, count in enumerate(orders)]
+    peak = max(free) or 1
+    spark = "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(value / peak * len(SPARK_CHARS)))] for value in free)
+    index = unusable_index(orders, huge_order)
+    lines = [
+        f"{FRAG_ICON} | Free by order {c(spark, COLORS['cyan'])}",
+        f"{FRAG_ICON} | Fragmented: {c(f'{index:.0f}%', get_color(index, 'mem_storage'))} unusable for {format_bytes(huge_size)}",
+    ]
+
+    if thp and thp.get("enabled"):
+        line = f"{FRAG_ICON} | THP {thp['enabled']}, defrag {thp.get('defrag') or '?'}"
+        if "thp_fault_alloc" in rates and "thp_fault_fallback" in rates:
+            alloc, fallback = rates["thp_fault_alloc"], rates["thp_fault_fallback"]
+            failed = fallback / (alloc + fallback) * 100 if alloc + fallback else 0
+            line += f": {format_rate(alloc)}, {c(f'{failed:.0f}%', get_color(failed, 'mem_storage'))} fallback"
+        lines.append(line)
+    if "compact_stall" in rates:
+        lines.append(f"{FRAG_ICON} | Compaction stalls: {format_rate(rates['compact_stall'])}")
+    return lines
+
+# ---------------------------------------------------
+# TOOLTIP
+# ---------------------------------------------------
+def render(sample):
+    meminfo = sample["meminfo"]
+    mem_total = meminfo["MemTotal"]
+    mem_free = meminfo.get("MemFree", 0)
+    mem_available = meminfo.get("MemAvailable", mem_free)
+    mem_buffers = meminfo.get("Buffers", 0)
+    mem_shmem = meminfo.get("Shmem", 0)
+    mem_slab = meminfo.get("SReclaimable", 0)
+    mem_dirty = meminfo.get("Dirty", 0) + meminfo.get("Writeback", 0)
+    # Same split as free(1): Cached includes Shmem (tmpfs, not reclaimable) and
+    # the dirty/writeback pages, carve them out so the bar segments don't overlap
+    mem_cached = max(0, meminfo.get("Cached", 0) - mem_shmem - mem_dirty)
+    mem_used = mem_total - mem_free - mem_buffers - meminfo.get("Cached", 0) - mem_slab
+    if mem_used < 0: mem_used = mem_total - mem_free
+    # zram and the zswap pool are kernel allocations inside "used"
+    mem_compressed = min(mem_used, sum(dev["used"] for dev in sample["zram"]) + meminfo.get("Zswap", 0))
+
+    mem_used_gb = mem_used / (1024**3)
+    mem_total_gb = mem_total / (1024**3)
+    mem_percent = round((mem_total - mem_available) / mem_total * 100, 1)
+
+    tooltip_lines = []
+
+    # Header
+    tooltip_lines.append(
+        f"<span foreground='{SECTION_COLORS['Memory']['icon']}'>{MEM_ICON}</span> "
+        f"<span foreground='{SECTION_COLORS['Memory']['text']}'>Memory</span>"
+    )
+    tooltip_lines.append("─" * TOOLTIP_WIDTH)
+    tooltip_lines.append(f"󰓅 | Usage: <span foreground='{get_color(mem_percent,'mem_storage')}'>{mem_used_gb:.0f} GB</span> used / {mem_total_gb:.0f} GB Total")
+
+    # Stall averages over 10s / 60s / 300s
+    for kind, averages in sample["psi"].items():
+        values = " / ".join(c(f"{avg:.2f}", get_color(avg, "mem_psi")) for avg in averages)
+        tooltip_lines.append(f"{PSI_ICON} | Stall {kind}: {values} %")
+
+    tooltip_lines.extend(render_trend(sample["history"], sample["now"], mem_available, mem_total))
+
+    memory_modules = sample["modules"]
+    max_line_len = TOOLTIP_WIDTH
+
+    # Module Table
+    if memory_modules:
+        rows = []
+        for mod in memory_modules:
+            t_val = mod.get('temp', 0)
+            rows.append({
+                "icon": MEM_ICON,
+                "label": mod.get("label", "DIMM"),
+                "size": mod.get("size", "N/A"),
+                "speed": mod.get("speed", "N/A"),
+                "type": mod.get("type", "DDR4"),
+                "temp_text": f"{t_val}°C",
+                "temp_val": t_val
+            })
+
+        # Calculate column widths
+        w_label = max(len(r["label"]) for r in rows)
+        w_size = max(len(r["size"]) for r in rows)
+        w_speed = max(len(r["speed"]) for r in rows)
+        w_type = max(len(r["type"]) for r in rows)
+        w_temp = max(len(r["temp_text"]) for r in rows)
+
+        tooltip_lines.append("")
+        for r in rows:
+            temp_colored = f"<span foreground='{get_color(r['temp_val'], 'mem_temp')}'>{r['temp_text']:>{w_temp}}</span>"
+            line = (
+                f"{r['icon']} | "
+                f"{r['label']:<{w_label}} | "
+                f"{r['size']:<{w_size}} | "
+                f"{r['type']:<{w_type}} | "
+                f"{r['speed']:<{w_speed}} | "
+                f"{temp_colored}"
+            )
+            tooltip_lines.append(line)
+
+    tooltip_lines.append("")
+
+    # Calculate max temp for connectors
+    max_mem_temp = 0
+    if memory_modules:
+        max_mem_temp = max(m.get('temp', 0) for m in memory_modules)
+
+    connector_color = get_color(max_mem_temp, 'mem_temp')
+    frame_color = COLORS['white']
+
+    # Bar segments, in order, free takes whatever is left
+    segments = [
+        ("Used",    mem_used - mem_compressed, COLORS["red"]),
+        ("Compressed", mem_compressed, COLORS["bright_magenta"]),
+        ("Shmem",   mem_shmem,   COLORS["magenta"]),
+        ("Cached",  mem_cached,  COLORS["yellow"]),
+        ("Dirty",   mem_dirty,   COLORS["bright_yellow"]),
+        ("Slab",    mem_slab,    COLORS["blue"]),
+        ("Buffers", mem_buffers, COLORS["cyan"]),
+    ]
+    segment_pcts = [(label, value / mem_total * 100, color) for label, value, color in segments]
+    free_pct = max(0, 100.0 - sum(pct for _, pct, _ in segment_pcts))
+
+    # Graphic Dimensions
+    graph_width = max_line_len - 2
+    inner_width = graph_width - 4
+    bar_len = inner_width - 2
+    padding = " " * int((max_line_len - graph_width) // 2)
+
+    # Line 1
+    tooltip_lines.append(f"{padding} {c('╭' + '─'*inner_width + '╮', frame_color)}")
+    # Line 2
+    tooltip_lines.append(f"{padding}{c('╭╯', frame_color)}{c('░'*inner_width, connector_color)}{c('╰╮', frame_color)}")
+    # Line 3 (Bar)
+    bar_str = ""
+    c_free = bar_len
+    for label, pct, color in segment_pcts:
+        cells = min(c_free, int((pct / 100.0) * bar_len))
+        c_free -= cells
+        if cells: bar_str += c('█' * cells, color)
+    bar_str += c('█' * c_free, COLORS['bright_black'])
+    tooltip_lines.append(f"{padding}{c('╰╮', frame_color)}{c('░', connector_color)}{bar_str}{c('░', connector_color)}{c('╭╯', frame_color)}")
+    # Line 4
+    tooltip_lines.append(f"{padding} {c('│', frame_color)}{c('░'*inner_width, connector_color)}{c('│', frame_color)}")
+    # Line 5
+    tooltip_lines.append(f"{padding}{c('╭╯', frame_color)}{c('┌' + '┬'*bar_len + '┐', frame_color)}{c('╰╮', frame_color)}")
+    # Line 6
+    tooltip_lines.append(f"{padding}{c('└─', frame_color)}{c('┴'*inner_width, frame_color)}{c('─┘', frame_color)}")
+
+    tooltip_lines.append("─" * max_line_len)
+
+    legend_items = [f"{c('█', color)} {label} {pct:.1f}%" for label, pct, color in segment_pcts]
+    legend_items.append(f"{c('█', COLORS['bright_black'])} Free {free_pct:.1f}%")
+
+    commit_limit = meminfo.get("CommitLimit", 0)
+    committed = meminfo.get("Committed_AS", 0)
+    commit_pct = committed / commit_limit * 100 if commit_limit else 0
+    details = [
+        f"Dirty {format_bytes(meminfo.get('Dirty', 0))}  Writeback {format_bytes(meminfo.get('Writeback', 0))}  "
+        f"AnonHuge {format_bytes(meminfo.get('AnonHugePages', 0))}  Mlocked {format_bytes(meminfo.get('Mlocked', 0))}",
+        f"Commit {format_bytes(committed)} / {format_bytes(commit_limit)} "
+        f"{c(f'({commit_pct:.0f}%)', get_color(commit_pct, 'mem_storage'))}",
+    ]
+
+    legend = (
+        f"<span size='11000'>"
+        f"{'  '.join(legend_items[:4])}\n{'  '.join(legend_items[4:])}\n"
+        f"{'\n'.join(details)}"
+        f"</span>"
+    )
+    tooltip_lines.append(legend)
+
+    # NUMA nodes (a single node is the totals above)
+    if len(sample["numa"]) > 1:
+        tooltip_lines.append("")
+        tooltip_lines.extend(render_numa(sample["numa"], sample["rates"]))
+
+    # Swap & Compression
+    swap_total = meminfo.get("SwapTotal", 0)
+    if swap_total or sample["zram"]:
+        tooltip_lines.append("")
+        swap_used = swap_total - meminfo.get("SwapFree", 0)
+        tooltip_lines.append(f"{SWAP_ICON} | Swap: {format_bytes(swap_used)} / {format_bytes(swap_total)}")
+        rates = sample["rates"]
+        if "pswpin" in rates and "pswpout" in rates:
+            paging = [
+                f"{direction} {c(f'{format_bytes(rates[key] * PAGE_SIZE)}/s', get_color(rates[key] * PAGE_SIZE / 1024**2, 'mem_swap_rate'))}"
+                for direction, key in (("in", "pswpin"), ("out", "pswpout"))
+            ]
+            tooltip_lines.append(f"{SWAP_ICON} | Paging: {', '.join(paging)}")
+
+        for dev in sample["zram"]:
+            ratio = dev["orig"] / dev["compr"] if dev["compr"] else 0
+            line = f"{ZRAM_ICON} | {dev['name']}: {format_bytes(dev['orig'])} → {format_bytes(dev['used'])} RAM ({ratio:.1f}x)"
+            if dev["failed"]: line += f" {c(f'{dev['failed']} failed', COLORS['red'])}"
+            tooltip_lines.append(line)
+
+        # Zswap fields only exist when the kernel is built with it
+        if meminfo.get("Zswapped"):
+            ratio = meminfo["Zswapped"] / meminfo["Zswap"] if meminfo.get("Zswap") else 0
+            tooltip_lines.append(f"{ZRAM_ICON} | zswap: {format_bytes(meminfo['Zswapped'])} → {format_bytes(meminfo.get('Zswap', 0))} RAM ({ratio:.1f}x)")
+
+    # Fragmentation & THP
+    if sample["buddyinfo"]:
+        tooltip_lines.append("")
+        tooltip_lines.extend(render_fragmentation(sample["buddyinfo"], sample["thp"], sample["rates"], meminfo))
+
+    # Top Processes
+    tooltip_lines.append("")
+    tooltip_lines.append(f"Top Memory Consumers ({TOP_METRIC.upper()}):")
+    for name, pss, uss in sample["top_processes"]:
+        if len(name) > 15: name = name[:14] + "…"
+        value, other = (pss, f"USS {format_bytes(uss)}") if TOP_METRIC == "pss" else (uss, f"PSS {format_bytes(pss)}")
+        color = get_color(value / mem_total * 100, "mem_storage")
+        tooltip_lines.append(f" • {name:<15} <span foreground='{color}'>{format_bytes(value):>8}</span>  {other}")
+
+    return {
+        "text": f"{MEM_ICON} <span foreground='{get_color(mem_percent,'mem_storage')}'>{mem_percent}%</span>",
+        "tooltip": f"<span size='14000'>{'\n'.join(tooltip_lines)}</span>",
+        "markup": "pango",
+        "class": "memory",
+    }
+
+# ---------------------------------------------------
+# MAIN LOGIC
+# ---------------------------------------------------
+def run_once():
+    state = new_state(load_counters(COUNTERS_FILE, COUNTER_TABLES))
+    output = render(collect(state))
+    save_counters(COUNTERS_FILE, state["counters"], COUNTER_TABLES)
+    print(json.dumps(output))
+
+def run_stream():
+    state = new_state({})
+    poller = select.poll()
+    fds = open_psi_triggers()
+    for fd in fds:
+        poller.register(fd, select.POLLPRI)
+
+    def wait(elapsed):
+        # With triggers a stall wakes us up right away, so the regular
+        # refresh only has to keep the usage figures current
+        for fd, event in poller.poll((IDLE_INTERVAL if fds else STREAM_INTERVAL) * 1000):
+            if event & (select.POLLERR | select.POLLNVAL):
+                poller.unregister(fd)
+                fds.remove(fd)
+
+    stream(lambda: render(collect(state)), wait)
+
+if __name__ == "__main__":
+    if "--stream" in sys.argv[1:]: run_stream()
+    else: run_once()
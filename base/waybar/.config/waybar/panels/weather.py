@@ -1,36 +1,41 @@
 #!/usr/bin/env python3
 
-import requests
 import json
+import os
 import sys
-from datetime import datetime
-import calendar
 import pathlib
 import time
-import pickle
-import html
 
-# Optional: tomllib for reading theme (Python 3.11+)
-try:
-    import tomllib
-except ImportError:
-    tomllib = None
+# Everything else is imported where it's used: a steady-state run only
+# reads OUTPUT_CACHE_FILE and prints it
 
 # ---------------- CONFIG
-# Replace LAT/LON with your own location coordinates
-LAT = "48.856613"
-LON = "2.352222"
+# Locations as (display name, latitude, longitude), all fetched in one
+# request. The first one is shown in the bar, the others get a tooltip row
+LOCATIONS = [
+    ("Paris", "48.856613", "2.352222"),
+]
 
-# Display name for your location
-DISPLAY_NAME = "Paris"
+# Open-Meteo host, WEATHER_API_URL points the fetches elsewhere, e.g. at the
+# local stand-in from bench/openmeteo_stub.py
+API_URL = os.environ.get("WEATHER_API_URL", "https://api.open-meteo.com").rstrip("/")
 
 # Cache timeout in seconds (default: 15 minutes)
 CACHE_TIMEOUT = 900
 
+# Seconds between two fetch attempts while the network is down
+RETRY_INTERVAL = 60
+
 # ---------------- PATHS
 # Cache file for weather data
 CACHE_FILE = pathlib.Path.home() / ".cache" / "waybar_weather_cache.pkl"
 
+# Last rendered output line and the key it was rendered for
+OUTPUT_CACHE_FILE = pathlib.Path.home() / ".cache" / "waybar_weather_output.json"
+
+# Held by the background refresher, holds the time of its last attempt
+LOCK_FILE = pathlib.Path.home() / ".cache" / "waybar_weather.lock"
+
 # Optional: Path to your theme file to match colors
 THEME_FILE = pathlib.Path.home() / ".config/omarchy/current/theme/alacritty.toml"
 
@@ -124,7 +129,10 @@ def load_omarchy_colors():
     defaults = {"white": "#ffffff", "red": "#ff0000", "yellow": "#ffff00",
                 "green": "#00ff00", "blue": "#0000ff", "cyan": "#00ffff",
                 "purple": "#ca9ee6", "bright_black": "#555555"}
-    if not tomllib or not THEME_FILE.exists(): return defaults
+    # Optional: tomllib for reading theme (Python 3.11+)
+    try: import tomllib
+    except ImportError: return defaults
+    if not THEME_FILE.exists(): return defaults
     try:
         data = tomllib.loads(THEME_FILE.read_text())
         colors = data.get("colors", {})
@@ -141,9 +149,13 @@ def load_omarchy_colors():
         }
     except Exception: return defaults
 
-COLORS = load_omarchy_colors()
-COLOR_MAP = {"green": COLORS["green"], "yellow": COLORS["yellow"], "orange": "#ef9f76",
-             "red": COLORS["red"], "blue": COLORS["blue"], "purple": COLORS["purple"]}
+# Filled by init_colors() before rendering, cached runs never read the theme
+COLORS, COLOR_MAP = {}, {}
+
+def init_colors():
+    COLORS.update(load_omarchy_colors())
+    COLOR_MAP.update({"green": COLORS["green"], "yellow": COLORS["yellow"], "orange": "#ef9f76",
+                      "red": COLORS["red"], "blue": COLORS["blue"], "purple": COLORS["purple"]})
 
 def temp_to_color(temp):
     TEMP_COLORS = [(15, COLORS["blue"]), (18, COLORS["blue"]), (21, COLORS["cyan"]),
@@ -153,19 +165,112 @@ def temp_to_color(temp):
         if temp <= t_max: return color
     return COLORS["red"]
 
+# ---------------- FORECAST STORE
+# The Open-Meteo arrays are converted once, when they are fetched, into typed
+# columns keyed by epoch seconds, with the per-day aggregates precomputed, so
+# a render is a few bisects whatever the forecast horizon and resolution
+FORECAST_VERSION = 2
+
+# Daytime hours a day's weather code is picked from
+DAYTIME_HOURS = (9, 18)
+
+def parse_epoch(value, utc_offset):
+    """ISO local time (or date) of the forecast location -> epoch seconds."""
+    from datetime import datetime, timezone
+    if not isinstance(value, str): return int(value)
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()) - utc_offset
+
+def column(typecode, values, missing=0):
+    from array import array
+    return array(typecode, (missing if v is None else v for v in values))
+
+def build_forecast(data):
+    """Open-Meteo payload -> forecast store, see FORECAST STORE above."""
+    from bisect import bisect_left
+    # Without an offset, times are in the machine's timezone
+    utc_offset = data.get("utc_offset_seconds", time.localtime().tm_gmtoff)
+    hourly, daily = data["hourly"], data["daily"]
+
+    h_time = column('q', (parse_epoch(t, utc_offset) for t in hourly["time"]))
+    h_code = column('B', hourly["weather_code"])
+    h_prob = column('B', hourly.get("precipitation_probability", ()))
+    h_prob.extend([0] * (len(h_time) - len(h_prob)))
+    store = {
+        "utc_offset": utc_offset,
+        "current": data["current"],
+        "hourly": {
+            "time": h_time,
+            "temperature_2m": column('d', hourly["temperature_2m"], float("nan")),
+            "weather_code": h_code,
+            "precipitation_probability": h_prob,
+        },
+    }
+
+    d_time = column('q', (parse_epoch(t, utc_offset) for t in daily["time"]))
+    d_code, d_rain = column('B', daily["weather_code"]), column('B', ())
+    for i, day in enumerate(d_time):
+        start = bisect_left(h_time, day + DAYTIME_HOURS[0] * 3600)
+        end = bisect_left(h_time, day + DAYTIME_HOURS[1] * 3600)
+        codes = list(h_code[start:end])
+        if codes: d_code[i] = max(set(codes), key=codes.count)
+        if "precipitation_probability_max" in daily:
+            d_rain.append(daily["precipitation_probability_max"][i] or 0)
+        else:
+            d_rain.append(max(h_prob[bisect_left(h_time, day):bisect_left(h_time, day + 86400)], default=0))
+    store["daily"] = {
+        "time": d_time,
+        "weather_code": d_code,
+        "temperature_2m_min": column('d', daily["temperature_2m_min"], float("nan")),
+        "temperature_2m_max": column('d', daily["temperature_2m_max"], float("nan")),
+        "precipitation_probability_max": d_rain,
+        "sunrise": column('q', (parse_epoch(t, utc_offset) for t in daily["sunrise"])),
+        "sunset": column('q', (parse_epoch(t, utc_offset) for t in daily["sunset"])),
+    }
+    return store
+
+def build_store(payloads):
+    """Open-Meteo payloads, one per LOCATIONS entry -> what gets cached."""
+    return {
+        "version": FORECAST_VERSION,
+        "locations": [[lat, lon] for _, lat, lon in LOCATIONS],
+        "forecasts": [build_forecast(p) for p in payloads],
+    }
+
+def local_time(store, epoch):
+    """Wall-clock time at the forecast location."""
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(epoch + store["utc_offset"], timezone.utc)
+
 # ---------------- FETCH WEATHER DATA
-def get_weather_data():
-    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    if CACHE_FILE.exists():
-        try:
-            with open(CACHE_FILE, 'rb') as f:
-                cached = pickle.load(f)
-                if time.time() - cached['timestamp'] < CACHE_TIMEOUT:
-                    return cached['data']
-        except Exception: pass
+# Runs every few seconds but fetches every CACHE_TIMEOUT. Expired data keeps
+# being served while a single detached `weather.py --refresh` fetches the
+# next one, so the bar never waits on the network.
+def cache_age():
+    try: return time.time() - os.stat(CACHE_FILE).st_mtime
+    except OSError: return None
+
+def load_weather_data():
+    """Last fetched store, however old, None if there is none for LOCATIONS."""
+    import pickle
+    try:
+        with open(CACHE_FILE, 'rb') as f: data = pickle.load(f)['data']
+        # Raw payload from before the forecast store, one per location
+        if isinstance(data, dict) and "version" not in data: data = [data]
+        if isinstance(data, list) and len(data) == len(LOCATIONS): data = build_store(data)
+        # Older store, or LOCATIONS was edited since the fetch
+        if data.get("version") != FORECAST_VERSION: return None
+        if data["locations"] != [[lat, lon] for _, lat, lon in LOCATIONS]: return None
+        return data
+    except Exception: return None
+
+def fetch_weather_data():
+    # Importing requests is most of the startup time, only do it on a miss
+    import requests
 
+    # Comma separated coordinates: one response per location, in order
+    lats, lons = ",".join(l[1] for l in LOCATIONS), ",".join(l[2] for l in LOCATIONS)
     url = (
-        f"https://api.open-meteo.com/v1/forecast?latitude={LAT}&longitude={LON}"
+        f"{API_URL}/v1/forecast?latitude={lats}&longitude={lons}"
             "&current=temperature_2m,relative_humidity_2m,apparent_temperature,"
             "precipitation,rain,weather_code,wind_speed_10m,wind_direction_10m,uv_index"
             "&hourly=temperature_2m,weather_code,precipitation_probability,precipitation,is_day"
@@ -176,118 +281,255 @@ def get_weather_data():
         r = requests.get(url, timeout=10)
         r.raise_for_status()
         data = r.json()
-        with open(CACHE_FILE, 'wb') as f:
-            pickle.dump({'timestamp': time.time(), 'data': data}, f)
-        return data
+        # A single location comes back as a bare object
+        return [data] if isinstance(data, dict) else data
     except Exception:
         return None
 
+def start_refresh():
+    """Spawns a detached refresher unless one is running or just failed."""
+    import fcntl
+    import subprocess
+    try:
+        LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError: return
+    try:
+        # Held for the whole fetch by the running refresher
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        last_attempt = float(os.pread(fd, 32, 0) or 0)
+    except (OSError, ValueError): return
+    finally: os.close(fd)
+    # Offline: don't retry on every run
+    if time.time() - last_attempt < RETRY_INTERVAL: return
+
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "--refresh"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+def refresh_weather_data():
+    """--refresh: single-flight fetch, the new cache is renamed into place."""
+    import fcntl
+    import pickle
+    try:
+        LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # Another refresher is on it
+        return
+    # Another one may have finished between our spawn and the lock
+    age = cache_age()
+    if age is not None and age < CACHE_TIMEOUT and load_weather_data(): return
+
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, str(time.time()).encode(), 0)
+    data = fetch_weather_data()
+    if not data or len(data) != len(LOCATIONS): return
+    tmp = CACHE_FILE.with_name(f"{CACHE_FILE.name}.{os.getpid()}")
+    try:
+        store = build_store(data)
+        with open(tmp, 'wb') as f:
+            pickle.dump({'timestamp': time.time(), 'data': store}, f)
+        os.replace(tmp, CACHE_FILE)
+    except Exception:
+        try: os.unlink(tmp)
+        except OSError: pass
+
+# ---------------- OUTPUT CACHE
+def output_cache_key():
+    """
+    (data cache mtime, local hour, theme mtime, locations): the rendered
+    output only changes with one of these. None without data.
+    """
+    try: data_mtime = os.stat(CACHE_FILE).st_mtime_ns
+    except OSError: return None
+    try: theme_mtime = os.stat(THEME_FILE).st_mtime_ns
+    except OSError: theme_mtime = None
+    return [data_mtime, time.strftime("%Y-%m-%dT%H"), theme_mtime, [list(l) for l in LOCATIONS]]
+
+def read_output_cache(key):
+    if key is None: return None
+    try:
+        with open(OUTPUT_CACHE_FILE, 'r') as f: cached = json.load(f)
+        return cached['output'] if cached['key'] == key else None
+    except Exception: return None
+
+def write_output_cache(key, output):
+    if key is None: return
+    tmp = OUTPUT_CACHE_FILE.with_name(f"{OUTPUT_CACHE_FILE.name}.{os.getpid()}")
+    try:
+        with open(tmp, 'w') as f: json.dump({'key': key, 'output': output}, f, ensure_ascii=False)
+        os.replace(tmp, OUTPUT_CACHE_FILE)
+    except Exception:
+        try: os.unlink(tmp)
+        except OSError: pass
+
+# ---------------- RENDER
+def render_site(name, forecast, now):
+    """One tooltip row for an additional location: now, today's range and rain."""
+    from bisect import bisect_right
+    import html
+
+    curr, daily = forecast["current"], forecast["daily"]
+    today = max(bisect_right(daily["time"], now) - 1, 0)
+    temp, icon = curr["temperature_2m"], WEATHER_MAP.get(curr["weather_code"], ("❓", "Unknown"))[0]
+    d_min, d_max = daily["temperature_2m_min"][today], daily["temperature_2m_max"][today]
+    r_prob = daily["precipitation_probability_max"][today]
+    rain_color = COLORS['blue'] if r_prob > 0 else COLORS['bright_black']
+    return (f"<span font_family='monospace'>{html.escape(f'{name[:12]:<12}')} {icon:<2} "
+        f"<span foreground='{temp_to_color(temp)}'>{temp:>5.1f}°C</span>  "
+        f" <span foreground='{temp_to_color(d_min)}'>{d_min:>2.0f}</span> "
+        f" <span foreground='{temp_to_color(d_max)}'>{d_max:>2.0f}</span>  "
+        f"<span foreground='{rain_color}'> {r_prob:>2}%</span></span>")
+
+def render(store):
+    """Builds the waybar JSON line for a forecast store."""
+    from bisect import bisect_left, bisect_right
+    import calendar
+    import html
+
+    # The bar and most of the tooltip are about the first location
+    data = store["forecasts"][0]
+    curr, hourly, daily = data["current"], data["hourly"], data["daily"]
+    temp, feels_like, humidity = curr["temperature_2m"], curr["apparent_temperature"], curr["relative_humidity_2m"]
+    wind_kph, wind_dir = curr["wind_speed_10m"], get_wind_direction(curr["wind_direction_10m"])
+    uv_index = curr.get("uv_index", 0)
+    icon, desc = WEATHER_MAP.get(curr["weather_code"], ("❓", "Unknown"))
+
+    now = time.time()
+    # Today is wherever now falls, the cache may be from yesterday
+    today = max(bisect_right(daily["time"], now) - 1, 0)
+
+    # --- Tooltip Construction ---
+    lines = [f"<span size='large'> {html.escape(LOCATIONS[0][0])} - {icon} {desc}</span>"]
+    lines.append(f" <span foreground='{temp_to_color(temp)}'><b>{temp}°C</b></span> (Feels <span foreground='{temp_to_color(feels_like)}'>{feels_like}°C</span>)")
+    sunrise, sunset = local_time(data, daily["sunrise"][today]), local_time(data, daily["sunset"][today])
+    lines.append(f"  {sunrise:%H:%M}   {sunset:%H:%M}")
+    lines.append("")
+
+    w_desc, w_col = get_wind_description(wind_kph)
+    h_desc, h_col = get_humidity_info(humidity)
+    uv_desc, uv_col = get_uv_info(uv_index)
+    f_desc, f_col = calculate_fire_danger(temp, humidity, wind_kph)
+
+    lines.append(f" <span foreground='{COLOR_MAP.get(h_col, COLORS['white'])}'>{humidity}%</span> {html.escape(h_desc)}")
+    lines.append(f"󰖝 <span foreground='{COLOR_MAP.get(w_col, COLORS['white'])}'>{WIND_ARROWS.get(wind_dir, '○')} {wind_dir} {wind_kph}km/h ({w_desc})</span>")
+    lines.append(f"󰓄 <span foreground='{COLOR_MAP.get(uv_col, COLORS['white'])}'>UV: {uv_index} ({uv_desc})</span>")
+    lines.append(f"󱗗 <span foreground='{COLOR_MAP.get(f_col, COLORS['white'])}'>Fire: {f_desc}</span>")
+    lines.append("")
+
+    # --- Hourly Forecast ---
+    lines.append(f"<span foreground='{COLORS['yellow']}'><b> Today</b></span>")
+    clocks = ["󱑊","󱐿","󱑀","󱑁","󱑂","󱑃","󱑄","󱑅","󱑆","󱑇","󱑈","󱑉"]
+
+    # From the start of the current hour to midnight, one row per hour
+    hour_start = now - (now + data["utc_offset"]) % 3600
+    midnight = daily["time"][today + 1] if today + 1 < len(daily["time"]) else daily["time"][today] + 86400
+    for i in range(bisect_left(hourly["time"], hour_start), bisect_left(hourly["time"], midnight)):
+        dt_h = local_time(data, hourly["time"][i])
+        if dt_h.minute: continue
+        h_prob = hourly["precipitation_probability"][i]
+        h_temp = hourly["temperature_2m"][i]
+        h_icon, h_desc = WEATHER_MAP.get(hourly["weather_code"][i], (" ", "Unknown"))
+
+        rain_color = COLORS['blue'] if h_prob > 0 else COLORS['bright_black']
+        clock_icon = clocks[dt_h.hour % 12]
+        time_str = dt_h.strftime(f"{clock_icon} %I:%M %p")
+        label_col = f"{time_str:<12}"
+        rain_col = f"<span foreground='{rain_color}'> {h_prob:>2}%</span>"
+        temp_col = f"<span foreground='{temp_to_color(h_temp)}'> {h_temp:>5.2f}°C</span>"
+
+        lines.append(f"<span font_family='monospace'>{label_col}  {rain_col}  {temp_col}  {h_icon:<2} {h_desc}</span>")
+
+    # --- Tomorrow ---
+    lines.append(f"\n<span foreground='{COLORS['green']}'><b> Tomorrow</b></span>")
+    time_data = {7: ("󰖜","Morning"),12:("󰖙","Midday"),17:("󰖚","Arvo"),21:("󰖔","Evening")}
+
+    for hour, (glyph, label_text) in time_data.items():
+        i = bisect_left(hourly["time"], midnight + hour * 3600)
+        if i < len(hourly["time"]) and hourly["time"][i] == midnight + hour * 3600:
+            t_prob = hourly["precipitation_probability"][i]
+            t_temp = hourly["temperature_2m"][i]
+            t_icon,t_desc = WEATHER_MAP.get(hourly["weather_code"][i],(" ","Unknown"))
+            rain_color = COLORS['blue'] if t_prob > 0 else COLORS['bright_black']
+            label_col = f"{glyph} {label_text:<10}"
+            rain_col = f"<span foreground='{rain_color}'> {t_prob:>2}%</span>"
+            temp_col = f"<span foreground='{temp_to_color(t_temp)}'> {t_temp:>5.2f}°C</span>"
+            lines.append(f"<span font_family='monospace'>{label_col}  {rain_col}  {temp_col}  {t_icon:<2} {t_desc}</span>")
+
+    # --- Extended Forecast ---
+    lines.append(f"\n<span foreground='{COLORS['blue']}'><b> Extended Forecast</b></span>")
+
+    last_day = min(today + 7, len(daily["time"]))
+    for i in range(today + 1, last_day):
+        dt = local_time(data, daily["time"][i])
+        d_min,d_max = daily["temperature_2m_min"][i],daily["temperature_2m_max"][i]
+        r_prob = daily["precipitation_probability_max"][i]
+        d_code = daily["weather_code"][i]
+        d_icon,d_text = WEATHER_MAP.get(d_code,(" ","Unknown"))
+        rain_color = COLORS['blue'] if r_prob > 0 else COLORS['bright_black']
+        day_num = dt.strftime("%d")
+        calendar_tab = f"<span background='{COLORS['white']}' foreground='#1e1e2e'>{day_num}</span>"
+        day_name_str = f"{calendar.day_name[dt.weekday()]:<9}"
+        day_label = f"{calendar_tab} {day_name_str}"
+        t_min_s = f"<span foreground='{temp_to_color(d_min)}'>{d_min:>2.0f}</span>"
+        t_max_s = f"<span foreground='{temp_to_color(d_max)}'>{d_max:>2.0f}</span>"
+        temp_col = f" {t_min_s}  {t_max_s}"
+        line = (f"<span font_family='monospace'>{day_label}  "
+            f"<span foreground='{rain_color}'> {r_prob:>2}%</span>  "
+            f"{temp_col}  {d_icon:<2} {d_text}</span>")
+        lines.append(line)
+        if i < last_day - 1: lines.append("<span size='3000'> </span>")
+
+    # --- Other Locations ---
+    if len(store["forecasts"]) > 1:
+        lines.append(f"\n<span foreground='{COLORS['purple']}'><b> Other Locations</b></span>")
+        for (name, _, _), forecast in zip(LOCATIONS[1:], store["forecasts"][1:]):
+            lines.append(render_site(name, forecast, now))
+
+    lines.append(f"\n<span size='small' foreground='{COLORS['white']}'>🖱️LMB: Weather | 🖱️RMB: Radar</span>")
+
+    WAYBAR_TEMP_COLOR = COLORS["white"]
+    return json.dumps({
+        "text": f"| {icon} <span foreground='{WAYBAR_TEMP_COLOR}'>{temp}°C</span> ",
+        "tooltip": "\n".join(lines), "markup": "pango", "class": "weather"
+    }, ensure_ascii=False)
+
 # ---------------- MAIN FUNCTION
 def main():
-    data = get_weather_data()
+    age = cache_age()
+    stale = age is None or age >= CACHE_TIMEOUT
+    if stale: start_refresh()
+
+    # Steady state: same data, same hour, same theme -> same output. The key
+    # is taken before loading: if the refresher replaces the data meanwhile,
+    # what gets rendered is stored under the older key and simply misses next
+    # run, instead of old data being stored under the new file's key
+    key = output_cache_key()
+    output = read_output_cache(key)
+    if output:
+        print(output)
+        return
+
+    data = load_weather_data()
     if not data:
+        # A cache from an older version, or for other LOCATIONS
+        if not stale: start_refresh()
         print(json.dumps({"text": "N/A", "tooltip": "Weather unavailable"}))
         sys.exit(0)
 
+    init_colors()
     try:
-        curr, hourly, daily = data["current"], data["hourly"], data["daily"]
-        temp, feels_like, humidity = curr["temperature_2m"], curr["apparent_temperature"], curr["relative_humidity_2m"]
-        wind_kph, wind_dir = curr["wind_speed_10m"], get_wind_direction(curr["wind_direction_10m"])
-        uv_index = curr.get("uv_index", 0)
-        icon, desc = WEATHER_MAP.get(curr["weather_code"], ("❓", "Unknown"))
-
-        now_iso = datetime.now().isoformat()
-
-        # --- Tooltip Construction ---
-        lines = [f"<span size='large'> {DISPLAY_NAME} - {icon} {desc}</span>"]
-        lines.append(f" <span foreground='{temp_to_color(temp)}'><b>{temp}°C</b></span> (Feels <span foreground='{temp_to_color(feels_like)}'>{feels_like}°C</span>)")
-        lines.append(f"  {daily['sunrise'][0].split('T')[1]}   {daily['sunset'][0].split('T')[1]}")
-        lines.append("")
-
-        w_desc, w_col = get_wind_description(wind_kph)
-        h_desc, h_col = get_humidity_info(humidity)
-        uv_desc, uv_col = get_uv_info(uv_index)
-        f_desc, f_col = calculate_fire_danger(temp, humidity, wind_kph)
-
-        lines.append(f" <span foreground='{COLOR_MAP.get(h_col, COLORS['white'])}'>{humidity}%</span> {html.escape(h_desc)}")
-        lines.append(f"󰖝 <span foreground='{COLOR_MAP.get(w_col, COLORS['white'])}'>{WIND_ARROWS.get(wind_dir, '○')} {wind_dir} {wind_kph}km/h ({w_desc})</span>")
-        lines.append(f"󰓄 <span foreground='{COLOR_MAP.get(uv_col, COLORS['white'])}'>UV: {uv_index} ({uv_desc})</span>")
-        lines.append(f"󱗗 <span foreground='{COLOR_MAP.get(f_col, COLORS['white'])}'>Fire: {f_desc}</span>")
-        lines.append("")
-
-        # --- Hourly Forecast ---
-        lines.append(f"<span foreground='{COLORS['yellow']}'><b> Today</b></span>")
-        clocks = ["󱑊","󱐿","󱑀","󱑁","󱑂","󱑃","󱑄","󱑅","󱑆","󱑇","󱑈","󱑉"]
-
-        for i in range(24):
-            if hourly["time"][i] >= now_iso[:13]:
-                dt_h = datetime.fromisoformat(hourly["time"][i])
-                h_prob = hourly["precipitation_probability"][i]
-                h_temp = hourly["temperature_2m"][i]
-                h_icon, h_desc = WEATHER_MAP.get(hourly["weather_code"][i], (" ", "Unknown"))
-
-                rain_color = COLORS['blue'] if h_prob > 0 else COLORS['bright_black']
-                clock_icon = clocks[dt_h.hour % 12]
-                time_str = dt_h.strftime(f"{clock_icon} %I:%M %p")
-                label_col = f"{time_str:<12}"
-                rain_col = f"<span foreground='{rain_color}'> {h_prob:>2}%</span>"
-                temp_col = f"<span foreground='{temp_to_color(h_temp)}'> {h_temp:>5.2f}°C</span>"
-
-                lines.append(f"<span font_family='monospace'>{label_col}  {rain_col}  {temp_col}  {h_icon:<2} {h_desc}</span>")
-
-        # --- Tomorrow ---
-        lines.append(f"\n<span foreground='{COLORS['green']}'><b> Tomorrow</b></span>")
-        time_data = {7: ("󰖜","Morning"),12:("󰖙","Midday"),17:("󰖚","Arvo"),21:("󰖔","Evening")}
-
-        for i in range(24,48):
-            dt = datetime.fromisoformat(hourly["time"][i])
-            if dt.hour in time_data:
-                glyph,label_text = time_data[dt.hour]
-                t_prob = hourly["precipitation_probability"][i]
-                t_temp = hourly["temperature_2m"][i]
-                t_icon,t_desc = WEATHER_MAP.get(hourly["weather_code"][i],(" ","Unknown"))
-                rain_color = COLORS['blue'] if t_prob > 0 else COLORS['bright_black']
-                label_col = f"{glyph} {label_text:<10}"
-                rain_col = f"<span foreground='{rain_color}'> {t_prob:>2}%</span>"
-                temp_col = f"<span foreground='{temp_to_color(t_temp)}'> {t_temp:>5.2f}°C</span>"
-                lines.append(f"<span font_family='monospace'>{label_col}  {rain_col}  {temp_col}  {t_icon:<2} {t_desc}</span>")
-
-        # --- Extended Forecast ---
-        lines.append(f"\n<span foreground='{COLORS['blue']}'><b> Extended Forecast</b></span>")
-
-        for i in range(1, min(7,len(daily["time"]))):
-            dt = datetime.fromisoformat(daily["time"][i])
-            d_min,d_max = daily["temperature_2m_min"][i],daily["temperature_2m_max"][i]
-            r_prob = daily.get("precipitation_probability_max",[0]*7)[i]
-            start_idx,end_idx = i*24+9,i*24+18
-            daytime_codes = hourly["weather_code"][start_idx:end_idx]
-            d_code = max(set(daytime_codes), key=daytime_codes.count) if daytime_codes else daily["weather_code"][i]
-            d_icon,d_text = WEATHER_MAP.get(d_code,(" ","Unknown"))
-            rain_color = COLORS['blue'] if r_prob > 0 else COLORS['bright_black']
-            day_num = dt.strftime("%d")
-            calendar_tab = f"<span background='{COLORS['white']}' foreground='#1e1e2e'>{day_num}</span>"
-            day_name_str = f"{calendar.day_name[dt.weekday()]:<9}"
-            day_label = f"{calendar_tab} {day_name_str}"
-            t_min_s = f"<span foreground='{temp_to_color(d_min)}'>{d_min:>2.0f}</span>"
-            t_max_s = f"<span foreground='{temp_to_color(d_max)}'>{d_max:>2.0f}</span>"
-            temp_col = f" {t_min_s}  {t_max_s}"
-            line = (f"<span font_family='monospace'>{day_label}  "
-                f"<span foreground='{rain_color}'> {r_prob:>2}%</span>  "
-                f"{temp_col}  {d_icon:<2} {d_text}</span>")
-            lines.append(line)
-            if i<6: lines.append("<span size='3000'> </span>")
-
-        lines.append(f"\n<span size='small' foreground='{COLORS['white']}'>🖱️LMB: Weather | 🖱️RMB: Radar</span>")
-
-        WAYBAR_TEMP_COLOR = COLORS["white"]
-        print(json.dumps({
-            "text": f"| {icon} <span foreground='{WAYBAR_TEMP_COLOR}'>{temp}°C</span> ",
-            "tooltip": "\n".join(lines), "markup": "pango", "class": "weather"
-        }, ensure_ascii=False))
-
+        output = render(data)
     except Exception as e:
         print(json.dumps({"text": "Error", "tooltip": str(e)}))
+        return
+
+    write_output_cache(key, output)
+    print(output)
 
 if __name__ == "__main__":
-    main()
+    if "--refresh" in sys.argv[1:]: refresh_weather_data()
+    else: main()
 
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# WAYBAR PANELS BENCHMARK
+# ----------------------------------------------------------------------------
+# Measures what one invocation of the waybar panels costs, against a fake
+# /proc and /sys tree so it runs the same on any Linux box (no RAPL, hwmon
+# or DIMM sensors needed).
+# Features:
+# - Synthetic fixture trees, or trees recorded from a real machine
+# - Stubbed external commands (sudo/dmidecode) and a warm weather cache
+# - Wall time, CPU time, peak RSS, import time and child processes per run
+# - Stored baseline and hard budgets, regressions are flagged and exit
+#   non-zero
+#
+# Usage:
+#   bench_panels.py                       bench against a synthetic 16 CPU box
+#   bench_panels.py --fixture DIR         bench against a recorded tree
+#   bench_panels.py --save-baseline       store the results as the new baseline
+#   bench_panels.py record DIR            record this machine into DIR
+#   bench_panels.py synth DIR [--cpus N] [--nodes N]
+#                                         write the synthetic tree into DIR
+#
+# Run it with the interpreter waybar uses, the panels need Python 3.12+.
+# The baseline (bench/baseline.json) holds timings of this machine and isn't
+# committed: run --save-baseline once on each machine before comparing, until
+# then only the hard budgets are checked.
+# ----------------------------------------------------------------------------
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import pathlib
+import pickle
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# ---------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------
+REPO = pathlib.Path(__file__).resolve().parent.parent
+PANELS_DIR = REPO / "base/waybar/.config/waybar/panels"
+PANELS = ["cpu", "memory", "weather"]
+BASELINE_FILE = pathlib.Path(__file__).resolve().parent / "baseline.json"
+RUNS = 10
+
+# Allowed slowdown vs the baseline before a metric is flagged
+TOLERANCE = {"wall_ms": 0.25, "cpu_ms": 0.25, "rss_mb": 0.10, "import_ms": 0.25, "forks": 0.0}
+
+# Hard ceilings checked whatever the baseline says
+BUDGETS = {"weather": {"import_ms": 15.0}}
+# Modules a warm run must not import: weather only needs the network stack
+# once its cache expired
+FORBIDDEN_IMPORTS = {"weather": ["requests", "urllib3"]}
+
+# External commands the panels may run, each stub prints <fixture>/cmd/<name>.out
+STUBS = ["dmidecode"]
+
+# Audit events of a process starting a child. Loaded through sitecustomize,
+# it sees every spawn: stubbed commands, real binaries and the panels' own
+# Python children (weather.py's background --refresh)
+SPAWN_EVENTS = {"subprocess.Popen", "os.fork", "os.forkpty", "os.posix_spawn", "os.system"}
+SPAWN_HOOK = f"""import os, sys
+def _log_spawn(event, args):
+    if event in {sorted(SPAWN_EVENTS)!r}:
+        with open(os.environ["BENCH_FORK_LOG"], "a") as f: f.write(event + "\\n")
+if os.environ.get("BENCH_FORK_LOG"): sys.addaudithook(_log_spawn)
+"""
+
+# What `record` copies from the live machine
+RECORD_PROC = [
+    "stat", "uptime", "cpuinfo", "meminfo", "vmstat", "buddyinfo", "pressure/memory", "sys/kernel/random/boot_id",
+]
+RECORD_PID = ["stat", "cmdline", "smaps_rollup"]
+RECORD_SYS = [
+    "devices/system/cpu/cpu[0-9]*/topology/*",
+    "devices/system/cpu/cpu[0-9]*/cache/index3/id",
+    "devices/system/cpu/cpu[0-9]*/cpufreq/*",
+    "devices/system/cpu/cpu[0-9]*/thermal_throttle/*",
+    "class/powercap/*/*",
+    "class/hwmon/hwmon*/name",
+    "class/hwmon/hwmon*/temp*_input",
+    "class/hwmon/hwmon*/energy*_*",
+    "devices/system/node/node*/meminfo",
+    "devices/system/node/node*/numastat",
+    "kernel/mm/transparent_hugepage/enabled",
+    "kernel/mm/transparent_hugepage/defrag",
+    "block/zram*/mm_stat",
+    "block/zram*/io_stat",
+]
+# Symlinks whose target name the panels parse (e.g. the i2c address)
+RECORD_LINKS = [
+    "class/hwmon/hwmon*/device",
+]
+RECORD_CMDS = {
+    "dmidecode": ["sudo", "-n", "/usr/sbin/dmidecode", "--type", "memory"],
+}
+
+# ---------------------------------------------------
+# FIXTURES
+# ---------------------------------------------------
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+def synth(root, cpus=16, processes=400, seed=1, nodes=1):
+    """
+    Writes a plausible single package machine: SMT2 cores, cpufreq, RAPL
+    package/core/dram zones, k10temp and jc42 hwmon and a process table,
+    with its memory split across the given number of NUMA nodes.
+    """
+    rng = random.Random(seed)
+    proc, sys_ = root / "proc", root / "sys"
+    cores = cpus // 2
+
+    write(proc / "sys/kernel/random/boot_id", "00000000-0000-4000-8000-000000000000\n")
+    write(proc / "uptime", "123456.78 1800000.00\n")
+    write(proc / "cpuinfo", "".join(
+        f"processor\t: {cpu}\nmodel name\t: Fixture CPU {cores}-Core Processor\ncpu MHz\t\t: 3600.000\n\n"
+        for cpu in range(cpus)))
+    write(proc / "meminfo", "".join(f"{key}:{value:>16} kB\n" for key, value in [
+        ("MemTotal", 32_000_000), ("MemFree", 6_000_000), ("MemAvailable", 18_000_000),
+        ("Buffers", 400_000), ("Cached", 11_000_000), ("SwapCached", 0), ("Active", 12_000_000),
+        ("Inactive", 8_000_000), ("SwapTotal", 8_000_000), ("SwapFree", 8_000_000),
+        ("Dirty", 1_200), ("Writeback", 0), ("AnonPages", 9_000_000), ("Mapped", 1_000_000),
+        ("Shmem", 900_000), ("KReclaimable", 700_000), ("Slab", 1_000_000), ("SReclaimable", 700_000),
+        ("SUnreclaim", 300_000), ("Mlocked", 0), ("CommitLimit", 24_000_000),
+        ("Committed_AS", 20_000_000), ("AnonHugePages", 2_000_000), ("Zswap", 300_000),
+        ("Zswapped", 1_100_000),
+    ]))
+    write(proc / "vmstat", "".join(f"{key} {value}\n" for key, value in [
+        ("nr_free_pages", 1_500_000), ("nr_anon_pages", 2_250_000), ("nr_file_pages", 2_850_000),
+        ("pswpin", rng.randint(10**4, 10**5)), ("pswpout", rng.randint(10**5, 10**6)),
+        ("pgfault", rng.randint(10**7, 10**8)), ("pgmajfault", rng.randint(10**4, 10**5)),
+        ("thp_fault_alloc", rng.randint(10**4, 10**5)), ("thp_fault_fallback", rng.randint(10**3, 10**4)),
+        ("compact_stall", rng.randint(10, 1000)),
+    ]))
+    write(proc / "buddyinfo", "".join(
+        f"Node 0, zone {zone:>8} {' '.join(f'{count:6}' for count in counts)}\n" for zone, counts in [
+            ("DMA", [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 3]),
+            ("DMA32", [412, 380, 290, 210, 160, 120, 80, 41, 20, 9, 310]),
+            ("Normal", [48_211, 30_420, 18_877, 9_310, 4_102, 1_620, 540, 130, 22, 3, 0]),
+        ]))
+    write(proc / "pressure/memory",
+          "some avg10=1.42 avg60=0.61 avg300=0.20 total=8132521\n"
+          "full avg10=0.35 avg60=0.12 avg300=0.04 total=2201874\n")
+    write(proc / "stat", "".join(
+        f"cpu{'' if cpu < 0 else cpu} {rng.randint(10**5, 10**6)} 100 {rng.randint(10**4, 10**5)} {rng.randint(10**6, 10**7)} 500 0 300 0 0 0\n"
+        for cpu in range(-1, cpus)) + "intr 0\nctxt 0\n")
+
+    commands = ["/usr/bin/firefox", "/usr/bin/kitty", "/usr/bin/fish", "/usr/bin/code", "/usr/lib/systemd/systemd"]
+    for pid in range(1, processes + 1):
+        comm = os.path.basename(rng.choice(commands))
+        ticks = rng.randint(0, 50_000)
+        rss_kb = rng.randint(1_000, 800_000)
+        fields = ["S", "1", str(pid), str(pid), "0", "-1", "4194560", "0", "0", "0", "0",
+                  str(ticks), str(ticks // 4), "0", "0", "20", "0", "1", "0", str(1000 + pid), "0", str(rss_kb // 4)]
+        write(proc / str(pid) / "stat", f"{pid} ({comm}) {' '.join(fields)}\n")
+        write(proc / str(pid) / "cmdline", f"/usr/bin/{comm}\0--fixture\0")
+        write(proc / str(pid) / "smaps_rollup", "00400000-7ffff000 ---p 00000000 00:00 0    [rollup]\n" + "".join(
+            f"{key + ':':<16}{value:>8} kB\n" for key, value in [
+                ("Rss", rss_kb), ("Pss", rss_kb * 3 // 4), ("Shared_Clean", rss_kb // 2),
+                ("Private_Clean", rss_kb // 8), ("Private_Dirty", rss_kb * 3 // 8), ("Swap", 0),
+            ]))
+
+    cpu_dir = sys_ / "devices/system/cpu"
+    for cpu in range(cpus):
+        base = cpu_dir / f"cpu{cpu}"
+        write(base / "topology/physical_package_id", "0\n")
+        write(base / "topology/die_id", "0\n")
+        write(base / "topology/core_id", f"{cpu % cores}\n")
+        write(base / "cache/index3/id", f"{(cpu % cores) // 8}\n")
+        write(base / "cpufreq/scaling_cur_freq", f"{rng.randint(800_000, 4_800_000)}\n")
+        write(base / "cpufreq/scaling_max_freq", "4800000\n")
+        write(base / "cpufreq/cpuinfo_max_freq", "4800000\n")
+        write(base / "cpufreq/scaling_governor", "powersave\n")
+        write(base / "cpufreq/energy_performance_preference", "balance_performance\n")
+        write(base / "thermal_throttle/core_throttle_count", "0\n")
+        write(base / "thermal_throttle/package_throttle_count", "0\n")
+
+    for node in range(nodes):
+        base = sys_ / f"devices/system/node/node{node}"
+        write(base / "meminfo", "".join(f"Node {node} {key + ':':<15}{value // nodes:>9} kB\n" for key, value in [
+            ("MemTotal", 32_000_000), ("MemFree", 6_000_000 - node * 4_000_000), ("MemUsed", 26_000_000 + node * 4_000_000),
+            ("FilePages", 11_400_000), ("Shmem", 900_000), ("SReclaimable", 700_000),
+        ]))
+        write(base / "numastat", "".join(f"{key} {value}\n" for key, value in [
+            ("numa_hit", rng.randint(10**8, 10**9)), ("numa_miss", rng.randint(0, 10**6) if nodes > 1 else 0),
+            ("numa_foreign", rng.randint(0, 10**6) if nodes > 1 else 0), ("interleave_hit", 1000),
+            ("local_node", rng.randint(10**8, 10**9)), ("other_node", rng.randint(0, 10**6)),
+        ]))
+
+    for zone, name in [("intel-rapl:0", "package-0"), ("intel-rapl:0:0", "core"), ("intel-rapl:0:1", "dram")]:
+        base = sys_ / "class/powercap" / zone
+        write(base / "name", f"{name}\n")
+        write(base / "energy_uj", f"{rng.randint(0, 10**9)}\n")
+        write(base / "max_energy_range_uj", "262143328850\n")
+        write(base / "constraint_0_name", "long_term\n")
+        write(base / "constraint_0_power_limit_uw", "65000000\n")
+
+    write(sys_ / "kernel/mm/transparent_hugepage/enabled", "always [madvise] never\n")
+    write(sys_ / "kernel/mm/transparent_hugepage/defrag", "always defer defer+madvise [madvise] never\n")
+    write(sys_ / "block/zram0/mm_stat", f"{2_200_000_000} {560_000_000} {580_000_000} 0 {600_000_000} 12000 0 40 0\n")
+    write(sys_ / "block/zram0/io_stat", "0 0 0 1200\n")
+
+    hwmon = sys_ / "class/hwmon"
+    write(hwmon / "hwmon0/name", "k10temp\n")
+    write(hwmon / "hwmon0/temp1_input", "54250\n")
+    # Four slots with A2/B2 populated, the sensors answering at 0x19/0x1b
+    for i, addr in enumerate(["0019", "001b"]):
+        write(hwmon / f"hwmon{i + 1}/name", "jc42\n")
+        write(hwmon / f"hwmon{i + 1}/temp1_input", f"{41000 + i * 500}\n")
+        (hwmon / f"hwmon{i + 1}/device").symlink_to(f"../../../0-{addr}")
+
+    write(root / "cmd/dmidecode.out", "".join(
+        f"Memory Device\n\tSize: {'16384 MB' if slot.endswith('2') else 'No Module Installed'}\n"
+        f"\tLocator: DIMM_{slot}\n\tType: DDR5\n\tSpeed: 5600 MT/s\n\n"
+        for slot in ["A1", "A2", "B1", "B2"]))
+
+    write(root / "weather/forecast.json", json.dumps(synth_forecast(rng)))
+
+def synth_forecast(rng, days=7):
+    """An Open-Meteo forecast response starting today at midnight, local time."""
+    start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    hours = [start + datetime.timedelta(hours=h) for h in range(days * 24)]
+    codes = [0, 1, 2, 3, 45, 61, 63, 80, 95]
+    return {
+        "current": {
+            "temperature_2m": 17.4, "relative_humidity_2m": 63, "apparent_temperature": 16.8,
+            "precipitation": 0.0, "rain": 0.0, "weather_code": 2,
+            "wind_speed_10m": 14.2, "wind_direction_10m": 250, "uv_index": 3.1,
+        },
+        "hourly": {
+            "time": [h.strftime("%Y-%m-%dT%H:%M") for h in hours],
+            "temperature_2m": [round(12 + 8 * rng.random(), 1) for _ in hours],
+            "weather_code": [rng.choice(codes) for _ in hours],
+            "precipitation_probability": [rng.randint(0, 100) for _ in hours],
+            "precipitation": [round(rng.random(), 1) for _ in hours],
+            "is_day": [int(6 <= h.hour < 20) for h in hours],
+        },
+        "daily": {
+            "time": [(start + datetime.timedelta(days=d)).strftime("%Y-%m-%d") for d in range(days)],
+            "weather_code": [rng.choice(codes) for _ in range(days)],
+            "temperature_2m_max": [round(18 + 6 * rng.random(), 1) for _ in range(days)],
+            "temperature_2m_min": [round(8 + 4 * rng.random(), 1) for _ in range(days)],
+            "precipitation_probability_max": [rng.randint(0, 100) for _ in range(days)],
+            "sunrise": [(start + datetime.timedelta(days=d, hours=7, minutes=12)).strftime("%Y-%m-%dT%H:%M") for d in range(days)],
+            "sunset": [(start + datetime.timedelta(days=d, hours=19, minutes=48)).strftime("%Y-%m-%dT%H:%M") for d in range(days)],
+        },
+    }
+
+def advance(root, rng):
+    """Moves the synthetic counters forward like a few seconds of load would."""
+    proc = root / "proc"
+    lines = []
+    for line in (proc / "stat").read_text().splitlines():
+        if line.startswith("cpu"):
+            name, *values = line.split()
+            values = [int(v) for v in values]
+            values[0] += rng.randint(0, 400)
+            values[3] += rng.randint(0, 400)
+            line = " ".join([name, *map(str, values)])
+        lines.append(line)
+    (proc / "stat").write_text("\n".join(lines) + "\n")
+
+    vmstat = [line.split() for line in (proc / "vmstat").read_text().splitlines()]
+    (proc / "vmstat").write_text("".join(
+        f"{key} {int(value) + (rng.randint(0, 5_000) if key.startswith(('pswp', 'pgfault', 'thp_', 'compact_')) else 0)}\n"
+        for key, value in vmstat))
+    for numastat in glob.glob(str(root / "sys/devices/system/node/node*/numastat")):
+        path = pathlib.Path(numastat)
+        counts = [line.split() for line in path.read_text().splitlines()]
+        path.write_text("".join(f"{key} {int(value) + rng.randint(0, 20_000 if key == 'numa_hit' else 500)}\n" for key, value in counts))
+
+    for energy in glob.glob(str(root / "sys/class/powercap/*/energy_uj")):
+        path = pathlib.Path(energy)
+        path.write_text(f"{int(path.read_text()) + rng.randint(10**7, 10**8)}\n")
+
+    for stat in rng.sample(glob.glob(str(proc / "[0-9]*/stat")), 20):
+        path = pathlib.Path(stat)
+        head, rest = path.read_text().rsplit(") ", 1)
+        fields = rest.split()
+        fields[11] = str(int(fields[11]) + rng.randint(0, 500))
+        path.write_text(f"{head}) {' '.join(fields)}\n")
+
+def record(root):
+    """Copies the files the panels read from the live machine into root."""
+    def copy(src, dest):
+        try: write(dest, pathlib.Path(src).read_text(errors="replace"))
+        except OSError: pass
+
+    for name in RECORD_PROC:
+        copy(f"/proc/{name}", root / "proc" / name)
+    for pid_dir in glob.glob("/proc/[0-9]*"):
+        for name in RECORD_PID:
+            copy(f"{pid_dir}/{name}", root / "proc" / os.path.basename(pid_dir) / name)
+    for pattern in RECORD_SYS:
+        for path in glob.glob(f"/sys/{pattern}"):
+            if os.path.isfile(path): copy(path, root / "sys" / os.path.relpath(path, "/sys"))
+    for pattern in RECORD_LINKS:
+        for path in glob.glob(f"/sys/{pattern}"):
+            dest = root / "sys" / os.path.relpath(path, "/sys")
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.symlink_to(os.readlink(path))
+    for name, cmd in RECORD_CMDS.items():
+        try: out = subprocess.run(cmd, capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.TimeoutExpired): out = ""
+        write(root / "cmd" / f"{name}.out", out)
+    # Last forecast the weather panel fetched, if any. Its typed columns are
+    # arrays, they come back as lists, which the panel indexes the same way
+    try:
+        with open(pathlib.Path.home() / ".cache/waybar_weather_cache.pkl", "rb") as f:
+            write(root / "weather/forecast.json", json.dumps(pickle.load(f)["data"], default=list))
+    except Exception: pass
+
+# ---------------------------------------------------
+# SANDBOX
+# ---------------------------------------------------
+def make_sandbox(fixture, workdir):
+    """Stub binaries, the spawn hook, empty HOME/runtime dirs and the env pointing at them."""
+    bin_dir, fork_log = workdir / "bin", workdir / "forks.log"
+    for name in STUBS:
+        write(bin_dir / name, f'#!/bin/sh\ncat "{fixture}/cmd/{name}.out" 2>/dev/null\n')
+    # The panels call `sudo /usr/sbin/dmidecode`, route it to the stub
+    write(bin_dir / "sudo", '#!/bin/sh\nwhile [ "${1#-}" != "$1" ]; do shift; done\ncmd=$(basename "$1"); shift\nexec "$(dirname "$0")/$cmd" "$@"\n')
+    for stub in bin_dir.iterdir():
+        stub.chmod(0o755)
+    write(workdir / "site/sitecustomize.py", SPAWN_HOOK)
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{bin_dir}:{os.environ.get('PATH', '/usr/bin:/bin')}",
+        "HOME": str(workdir / "home"),
+        "XDG_RUNTIME_DIR": str(workdir / "run"),
+        "WAYBAR_PROC_ROOT": str(fixture / "proc"),
+        "WAYBAR_SYS_ROOT": str(fixture / "sys"),
+        "PYTHONPATH": str(workdir / "site"),
+        "BENCH_FORK_LOG": str(fork_log),
+    })
+    env.pop("WAYBAR_CLICK_TYPE", None)
+    (workdir / "home").mkdir(exist_ok=True)
+    (workdir / "run").mkdir(mode=0o700, exist_ok=True)
+
+    # A fresh weather cache, the state the panel is in between two fetches
+    forecast = fixture / "weather/forecast.json"
+    if forecast.exists():
+        cache = workdir / "home/.cache/waybar_weather_cache.pkl"
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache, "wb") as f:
+            pickle.dump({"timestamp": time.time(), "data": json.loads(forecast.read_text())}, f)
+    return env, fork_log
+
+def run_panel(panel, env, fork_log, extra_args=()):
+    """Runs one panel invocation, checks its output and returns its stderr."""
+    fork_log.write_text("")
+    proc = subprocess.Popen([sys.executable, *extra_args, str(PANELS_DIR / f"{panel}.py")],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{panel}.py exited with {proc.returncode}:\n{stderr.decode(errors='replace')}")
+    json.loads(stdout.decode().splitlines()[-1])
+    return stderr.decode(errors="replace")
+
+def measure(panel, env, fork_log):
+    """Wall/CPU time and peak RSS through wait4, which reports per child."""
+    fork_log.write_text("")
+    started = time.perf_counter()
+    pid = os.posix_spawn(sys.executable, [sys.executable, str(PANELS_DIR / f"{panel}.py")], env,
+                         file_actions=[(os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_WRONLY, 0) for fd in (1, 2)])
+    _, status, usage = os.wait4(pid, 0)
+    wall = time.perf_counter() - started
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{panel}.py failed, run it with the bench env to see why")
+    return {
+        "wall_ms": wall * 1000,
+        "cpu_ms": (usage.ru_utime + usage.ru_stime) * 1000,
+        "rss_mb": usage.ru_maxrss / 1024,
+        "forks": len(fork_log.read_text().split()),
+    }
+
+def import_time(panel, env, fork_log):
+    """
+    Sum of the top level cumulative times reported by -X importtime, in ms,
+    and the set of every module imported. site is left out: it is the
+    interpreter's own startup (and whatever .pth files pull in), not the panel.
+    """
+    stderr = run_panel(panel, env, fork_log, ("-X", "importtime"))
+    total, modules = 0, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  ") and name.strip() != "site": total += int(cumulative)
+        modules.add(name.strip())
+    return total / 1000, modules
+
+def bench(fixture, runs, synthetic):
+    """Returns ({panel: metrics}, {panel: imported modules})."""
+    results, imports = {}, {}
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory(prefix="bench_panels_") as tmp:
+        workdir = pathlib.Path(tmp)
+        for panel in PANELS:
+            if panel == "weather" and not (fixture / "weather/forecast.json").exists(): continue
+            env, fork_log = make_sandbox(fixture, workdir / panel)
+            # Warm up: boot caches and previous-tick counters, like a running bar
+            run_panel(panel, env, fork_log)
+            samples = []
+            for _ in range(runs):
+                if synthetic: advance(fixture, rng)
+                samples.append(measure(panel, env, fork_log))
+            results[panel] = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+            results[panel]["import_ms"], imports[panel] = import_time(panel, env, fork_log)
+    return results, imports
+
+# ---------------------------------------------------
+# REPORT
+# ---------------------------------------------------
+COLUMNS = [("wall_ms", "wall ms"), ("cpu_ms", "cpu ms"), ("rss_mb", "rss MB"), ("import_ms", "import ms"), ("forks", "forks")]
+
+def report(results, baseline):
+    """Prints the results next to the baseline, returns the flagged regressions."""
+    regressions = []
+    print(f"{'panel':<10}" + "".join(f"{label:>20}" for _, label in COLUMNS))
+    for panel, metrics in results.items():
+        cells = []
+        for key, _ in COLUMNS:
+            value, base = metrics[key], baseline.get(panel, {}).get(key)
+            cell = f"{value:.1f}"
+            if base is not None:
+                cell += f" ({(value - base) / base * 100:+.0f}%)" if base else f" ({value - base:+.0f})"
+                if value > base * (1 + TOLERANCE[key]) and value - base > 0.5:
+                    regressions.append(f"{panel} {key}: {base:.1f} -> {value:.1f}")
+                    cell = "!" + cell
+            cells.append(f"{cell:>20}")
+        print(f"{panel:<10}" + "".join(cells))
+    return regressions
+
+def check_budgets(results, imports):
+    """Hard limits that hold whatever the baseline, returns the violations."""
+    violations = []
+    for panel, budget in BUDGETS.items():
+        for key, limit in budget.items():
+            if panel in results and results[panel][key] > limit:
+                violations.append(f"{panel} {key}: {results[panel][key]:.1f} over the {limit:.0f} budget")
+    for panel, modules in FORBIDDEN_IMPORTS.items():
+        for module in sorted(set(modules) & imports.get(panel, set())):
+            violations.append(f"{panel} imports {module} on a warm run")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the waybar panels against fake /proc and /sys trees.")
+    sub = parser.add_subparsers(dest="command")
+    rec = sub.add_parser("record", help="record this machine into a fixture tree")
+    rec.add_argument("dest", type=pathlib.Path)
+    syn = sub.add_parser("synth", help="write the synthetic fixture tree")
+    syn.add_argument("dest", type=pathlib.Path)
+    syn.add_argument("--cpus", type=int, default=16)
+    syn.add_argument("--nodes", type=int, default=1)
+    parser.add_argument("--fixture", type=pathlib.Path, help="recorded tree (default: synthetic)")
+    parser.add_argument("--cpus", type=int, default=16, help="CPUs of the synthetic tree")
+    parser.add_argument("--nodes", type=int, default=1, help="NUMA nodes of the synthetic tree")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.dest)
+        return 0
+    if args.command == "synth":
+        synth(args.dest, cpus=args.cpus, nodes=args.nodes)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="bench_fixture_") as tmp:
+        fixture = args.fixture.resolve() if args.fixture else pathlib.Path(tmp)
+        if not args.fixture: synth(fixture, cpus=args.cpus, nodes=args.nodes)
+        results, imports = bench(fixture, args.runs, synthetic=not args.fixture)
+
+    try: baseline = json.loads(args.baseline.read_text())
+    except (OSError, ValueError):
+        baseline = {}
+        if not args.save_baseline: print(f"No baseline at {args.baseline}, run --save-baseline first\n")
+    regressions = report(results, baseline)
+    violations = check_budgets(results, imports)
+    if violations:
+        print("\nOver budget:\n" + "\n".join(f" • {v}" for v in violations))
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 1 if violations else 0
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(f" • {r}" for r in regressions))
+        return 1
+    return 1 if violations else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
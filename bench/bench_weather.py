@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# WEATHER NETWORK BENCHMARK
+# ----------------------------------------------------------------------------
+# Runs the two weather scripts against the Open-Meteo stand-in
+# (openmeteo_stub.py) under each fault profile. Their caches are empty
+# (cold) or expired (stale).
+# Features:
+# - Bar blocking: how long one invocation keeps waybar waiting for output
+# - Fresh data: how long until new data is on disk, in the background or not
+# - What the bar showed: a forecast, stale data or N/A
+#
+# Usage:
+#   bench_weather.py                         every profile, 3 runs each
+#   bench_weather.py --profile slow --profile hanging --runs 5
+#
+# Run it with the interpreter waybar uses, the panels need Python 3.12+.
+# Hanging profiles wait out the scripts' timeouts, count ~10 s per run.
+# ----------------------------------------------------------------------------
+
+import argparse
+import fcntl
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import openmeteo_stub
+
+# ---------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------
+REPO = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS = {
+    "waybar": REPO / "base/waybar/.config/waybar/panels/weather.py",
+    "hypr": REPO / "fedora/hypr/.config/hypr/UserScripts/Weather.py",
+}
+SCENARIOS = ["cold", "stale"]
+RUNS = 3
+
+# Longest wait for a background refresh, past weather.py's 10 s timeout
+REFRESH_DEADLINE = 20
+
+# hypr's Weather.py has no location of its own, skip its IP lookups
+HYPR_ENV = {"WEATHER_LAT": "48.8566", "WEATHER_LON": "2.3522"}
+
+# ---------------------------------------------------
+# SANDBOX
+# ---------------------------------------------------
+def make_home(script, scenario, seed_url):
+    """A fresh HOME, with an expired cache for the stale scenario."""
+    home = pathlib.Path(tempfile.mkdtemp(prefix=f"bench_weather_{script}_"))
+    (home / ".cache").mkdir()
+    if scenario == "stale":
+        env = sandbox_env(home, seed_url)
+        if script == "waybar":
+            subprocess.run([sys.executable, SCRIPTS[script], "--refresh"], env=env, check=True)
+            old = time.time() - 3600
+            os.utime(home / ".cache/waybar_weather_cache.pkl", (old, old))
+            # The seeding refresher's attempt would hold the next one back
+            (home / ".cache/waybar_weather.lock").unlink()
+        else:
+            subprocess.run([sys.executable, SCRIPTS[script]], env=env, check=True, capture_output=True)
+    return home
+
+def sandbox_env(home, api_url, scenario="cold"):
+    env = dict(os.environ, HOME=str(home), WEATHER_API_URL=api_url, **HYPR_ENV)
+    # hypr keeps its expiry inside the cache, expire everything instead
+    if scenario == "stale": env["WEATHER_CACHE_TTL"] = "0"
+    return env
+
+# ---------------------------------------------------
+# MEASUREMENTS
+# ---------------------------------------------------
+def shown(stdout):
+    """What the bar displays: N/A, Error or a forecast."""
+    try: text = json.loads(stdout)["text"]
+    except (ValueError, KeyError, TypeError): return "no output"
+    if "N/A" in text: return "N/A"
+    if text == "Error": return "Error"
+    return "forecast"
+
+def refresher_done(lock):
+    """weather.py's refresher has made its attempt and released the lock."""
+    try: fd = os.open(lock, os.O_RDONLY)
+    except OSError: return False
+    try:
+        if not os.pread(fd, 32, 0): return False
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        return True
+    except OSError: return False
+    finally: os.close(fd)
+
+def wait_fresh(cache, lock, start):
+    """
+    Seconds from start until cache was rewritten, None if it never was.
+    Without a lock the script fetches in the foreground, nothing to wait for.
+    """
+    deadline = time.time() + REFRESH_DEADLINE
+    while True:
+        try: mtime = os.stat(cache).st_mtime
+        except OSError: mtime = 0
+        if mtime >= start: return mtime - start
+        if not lock or refresher_done(lock) or time.time() > deadline: return None
+        time.sleep(0.005)
+
+def run(script, scenario, api_url, seed_url):
+    """One invocation: (blocking s, fresh data s or None, shown)."""
+    home = make_home(script, scenario, seed_url)
+    env = sandbox_env(home, api_url, scenario)
+    cache = home / ".cache" / ("waybar_weather_cache.pkl" if script == "waybar" else "open_meteo_cache.json")
+    lock = home / ".cache/waybar_weather.lock" if script == "waybar" else None
+
+    start = time.time()
+    proc = subprocess.run([sys.executable, SCRIPTS[script]], env=env, capture_output=True, text=True)
+    blocking = time.time() - start
+    fresh = wait_fresh(cache, lock, start)
+    shutil.rmtree(home)
+    return blocking, fresh, shown(proc.stdout)
+
+def bench(profiles, runs):
+    rows = []
+    # Stale caches are seeded from a healthy API
+    seed = openmeteo_stub.StubServer(0, openmeteo_stub.PROFILES["healthy"], seed=0).start()
+    try:
+        for name in profiles:
+            server = openmeteo_stub.StubServer(0, openmeteo_stub.PROFILES[name], seed=1).start()
+            try:
+                for script in SCRIPTS:
+                    for scenario in SCENARIOS:
+                        samples = [run(script, scenario, server.url, seed.url) for _ in range(runs)]
+                        rows.append((name, script, scenario, samples))
+                        print_row(*rows[-1])
+            finally: server.shutdown()
+    finally: seed.shutdown()
+    return rows
+
+# ---------------------------------------------------
+# REPORT
+# ---------------------------------------------------
+def print_header():
+    print(f"{'profile':<10}{'script':<8}{'cache':<7}{'blocking ms':>14}{'max':>9}{'fresh ms':>12}{'fresh':>8}  shown")
+
+def print_row(profile, script, scenario, samples):
+    blocking = [s[0] * 1000 for s in samples]
+    fresh = [s[1] * 1000 for s in samples if s[1] is not None]
+    outcomes = [s[2] for s in samples]
+    fresh_ms = f"{statistics.median(fresh):.0f}" if fresh else "-"
+    print(f"{profile:<10}{script:<8}{scenario:<7}{statistics.median(blocking):>14.0f}{max(blocking):>9.0f}"
+          f"{fresh_ms:>12}{f'{len(fresh)}/{len(samples)}':>8}  {max(set(outcomes), key=outcomes.count)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the weather scripts against the Open-Meteo stand-in.")
+    parser.add_argument("--profile", action="append", choices=openmeteo_stub.PROFILES,
+                        help="fault profile to run, repeatable (default: all)")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    print_header()
+    bench(args.profile or list(openmeteo_stub.PROFILES), args.runs)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------
+# OPEN-METEO STAND-IN
+# ----------------------------------------------------------------------------
+# A local HTTP server answering like the Open-Meteo APIs the weather scripts
+# use, so they can run offline and under controlled network faults.
+# Features:
+# - /v1/forecast, /v1/air-quality, /v1/search and /v1/reverse, plus
+#   Nominatim's /reverse used by hypr's Weather.py
+# - Recorded fixtures, moved to today and cut down to the requested variables
+# - Comma-separated coordinates answered with one response per location
+# - Fault profiles: latency, error rate and requests that hang
+#
+# Usage:
+#   openmeteo_stub.py                              serve healthy on port 8765
+#   openmeteo_stub.py --profile slow               serve a named fault profile
+#   openmeteo_stub.py --latency 800 --error-rate 0.2
+#                                                  tweak a profile
+#   openmeteo_stub.py record [--lat N --lon N]     refresh the fixtures from
+#                                                  the live APIs
+#
+# Then point the scripts at it:
+#   WEATHER_API_URL=http://127.0.0.1:8765 ~/.config/waybar/panels/weather.py
+# ----------------------------------------------------------------------------
+
+import argparse
+import datetime
+import json
+import math
+import pathlib
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------
+FIXTURES_DIR = pathlib.Path(__file__).resolve().parent / "fixtures/open-meteo"
+PORT = 8765
+
+# latency/jitter in ms, hang in s: a hanging request gets no answer for that
+# long, well past the scripts' timeouts
+PROFILES = {
+    "healthy": {"latency": 40, "jitter": 20, "error_rate": 0.0, "hang_rate": 0.0, "hang": 120},
+    "slow": {"latency": 4000, "jitter": 1000, "error_rate": 0.0, "hang_rate": 0.0, "hang": 120},
+    "flaky": {"latency": 150, "jitter": 100, "error_rate": 0.5, "hang_rate": 0.0, "hang": 120},
+    "down": {"latency": 20, "jitter": 10, "error_rate": 1.0, "hang_rate": 0.0, "hang": 120},
+    "hanging": {"latency": 0, "jitter": 0, "error_rate": 0.0, "hang_rate": 1.0, "hang": 120},
+}
+
+# Time-series blocks of the forecast and air-quality responses
+SECTIONS = ["current", "minutely_15", "hourly", "daily"]
+
+# What `record` asks the live APIs for: every variable either script uses
+LIVE_FORECAST = "https://api.open-meteo.com/v1/forecast"
+LIVE_AIR_QUALITY = "https://air-quality-api.open-meteo.com/v1/air-quality"
+LIVE_SEARCH = "https://geocoding-api.open-meteo.com/v1/search"
+RECORD_FORECAST = {
+    "current": "temperature_2m,relative_humidity_2m,apparent_temperature,is_day,precipitation,rain,"
+               "weather_code,pressure_msl,wind_speed_10m,wind_direction_10m,visibility,uv_index",
+    "hourly": "temperature_2m,relative_humidity_2m,weather_code,precipitation_probability,precipitation,is_day",
+    "daily": "weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max,sunrise,sunset",
+    "timezone": "auto",
+}
+RECORD_AIR_QUALITY = {"current": "european_aqi,pm10,pm2_5", "hourly": "european_aqi,pm10,pm2_5", "timezone": "auto"}
+RECORD_PLACES = ["Paris", "Lyon", "Marseille", "London", "Berlin", "Concord", "New York", "Tokyo"]
+
+# ---------------------------------------------------
+# FIXTURES
+# ---------------------------------------------------
+def load_fixtures(root=FIXTURES_DIR):
+    return {name: json.loads((root / f"{name}.json").read_text()) for name in ["forecast", "air-quality", "geocoding"]}
+
+def shift_iso(value, days):
+    """ISO date or minute-resolution time, moved by whole days."""
+    if len(value) == 10: return (datetime.date.fromisoformat(value) + datetime.timedelta(days=days)).isoformat()
+    return (datetime.datetime.fromisoformat(value) + datetime.timedelta(days=days)).strftime("%Y-%m-%dT%H:%M")
+
+def rebase(fixture):
+    """The fixture moved to today, in its own timezone, current time included."""
+    offset = datetime.timedelta(seconds=fixture.get("utc_offset_seconds", 0))
+    local_now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + offset
+    first = (fixture.get("daily") or fixture["hourly"])["time"][0]
+    days = (local_now.date() - datetime.date.fromisoformat(first[:10])).days
+
+    out = dict(fixture)
+    for section in SECTIONS:
+        if section not in fixture: continue
+        block = out[section] = dict(fixture[section])
+        if section == "current":
+            interval = block.get("interval", 900)
+            seconds = local_now.hour * 3600 + local_now.minute * 60
+            block["time"] = local_now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(seconds=seconds - seconds % interval)
+            block["time"] = block["time"].strftime("%Y-%m-%dT%H:%M")
+            continue
+        for key in ["time", "sunrise", "sunset"]:
+            if key in block: block[key] = [shift_iso(v, days) for v in block[key]]
+    return out
+
+def nearest_place(fixtures, lat, lon):
+    """Closest geocoding fixture entry, for the reverse endpoints."""
+    def distance(place):
+        dx = (place["longitude"] - lon) * math.cos(math.radians(lat))
+        return dx * dx + (place["latitude"] - lat) ** 2
+    return min(fixtures["geocoding"]["results"], key=distance)
+
+# ---------------------------------------------------
+# ENDPOINTS
+# ---------------------------------------------------
+# Each takes (fixtures, query) and returns (status, JSON body)
+def error(reason):
+    return {"error": True, "reason": reason}
+
+def parse_coords(query, lat_key="latitude", lon_key="longitude"):
+    """Comma-separated coordinate lists -> [(lat, lon)], None if invalid."""
+    lats = [v for v in query.get(lat_key, "").split(",") if v]
+    lons = [v for v in query.get(lon_key, "").split(",") if v]
+    if not lats or len(lats) != len(lons): return None
+    try: return [(float(lat), float(lon)) for lat, lon in zip(lats, lons)]
+    except ValueError: return None
+
+def answer_timeseries(fixture, query):
+    """Forecast/air-quality: the fixture with only the requested variables."""
+    coords = parse_coords(query)
+    if coords is None: return 400, error("Parameter 'latitude' and 'longitude' must have the same number of elements")
+    base = rebase(fixture)
+    body = {k: v for k, v in base.items() if k not in SECTIONS and not k.endswith("_units")}
+    for section in SECTIONS:
+        if section not in query: continue
+        names = [n for n in query[section].split(",") if n]
+        missing = [n for n in names if n not in base.get(section, {})]
+        if missing: return 400, error(f"Cannot initialize WeatherVariable from invalid String value {missing[0]}.")
+        keep = ["time", "interval"] + names
+        units = base.get(f"{section}_units", {})
+        body[f"{section}_units"] = {n: units[n] for n in keep if n in units}
+        body[section] = {n: base[section][n] for n in keep if n in base[section]}
+    answers = [dict(body, latitude=round(lat, 2), longitude=round(lon, 2)) for lat, lon in coords]
+    return 200, answers[0] if len(answers) == 1 else answers
+
+def answer_forecast(fixtures, query):
+    return answer_timeseries(fixtures["forecast"], query)
+
+def answer_air_quality(fixtures, query):
+    return answer_timeseries(fixtures["air-quality"], query)
+
+def answer_search(fixtures, query):
+    name = query.get("name", "").strip().lower()
+    if not name: return 400, error("Parameter 'name' is required")
+    count = int(query.get("count", 10))
+    results = [p for p in fixtures["geocoding"]["results"] if p["name"].lower().startswith(name)][:count]
+    # Like the real API: no results key at all when nothing matched
+    body = {"generationtime_ms": 0.5}
+    if results: body["results"] = results
+    return 200, body
+
+def answer_reverse(fixtures, query):
+    coords = parse_coords(query)
+    if not coords: return 400, error("Parameters 'latitude' and 'longitude' are required")
+    return 200, {"results": [nearest_place(fixtures, *coords[0])], "generationtime_ms": 0.5}
+
+def answer_nominatim(fixtures, query):
+    coords = parse_coords(query, "lat", "lon")
+    if not coords: return 400, {"error": {"code": 400, "message": "Parameter 'lat' and 'lon' are required"}}
+    place = nearest_place(fixtures, *coords[0])
+    return 200, {
+        "place_id": place["id"], "lat": str(place["latitude"]), "lon": str(place["longitude"]),
+        "name": place["name"], "display_name": f"{place['name']}, {place['admin1']}, {place['country']}",
+        "address": {"city": place["name"], "state": place["admin1"], "country": place["country"],
+                    "country_code": place["country_code"].lower()},
+    }
+
+ROUTES = {
+    "/v1/forecast": answer_forecast,
+    "/v1/air-quality": answer_air_quality,
+    "/v1/search": answer_search,
+    "/v1/reverse": answer_reverse,
+    "/reverse": answer_nominatim,
+}
+
+# ---------------------------------------------------
+# SERVER
+# ---------------------------------------------------
+class Handler(BaseHTTPRequestHandler):
+    server_version = "open-meteo-stub/1.0"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+        fault = self.server.fault()
+        if fault == "hang":
+            # No answer at all, the client has to time out
+            self.close_connection = True
+            return
+        if fault == "error": status, body = 503, error("Service temporarily unavailable (injected)")
+        elif url.path in ROUTES: status, body = ROUTES[url.path](self.server.fixtures, query)
+        else: status, body = 404, error("Not Found")
+
+        payload = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose: super().log_message(format, *args)
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=PORT, profile=PROFILES["healthy"], fixtures=None, seed=None, verbose=False):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.profile, self.verbose = profile, verbose
+        self.fixtures = fixtures or load_fixtures()
+        self.rng = random.Random(seed)
+        self.stopping = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def fault(self):
+        """Applies the profile to one request: None, "error" or "hang"."""
+        p = self.profile
+        if self.rng.random() < p["hang_rate"]:
+            self.stopping.wait(p["hang"])
+            return "hang"
+        time.sleep(max(0.0, p["latency"] + self.rng.uniform(-p["jitter"], p["jitter"])) / 1000)
+        if self.rng.random() < p["error_rate"]: return "error"
+        return None
+
+    def start(self):
+        """Serves from a background thread, for the benchmarks."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        # Release the hanging requests too
+        self.stopping.set()
+        super().shutdown()
+        self.server_close()
+
+# ---------------------------------------------------
+# RECORDING
+# ---------------------------------------------------
+def fetch_json(url, params):
+    with urllib.request.urlopen(f"{url}?{urllib.parse.urlencode(params)}", timeout=30) as r:
+        return json.load(r)
+
+def record(root, lat, lon):
+    """Replaces the fixtures with live responses for lat/lon."""
+    root.mkdir(parents=True, exist_ok=True)
+    coords = {"latitude": lat, "longitude": lon}
+    responses = {
+        "forecast": fetch_json(LIVE_FORECAST, dict(coords, **RECORD_FORECAST)),
+        "air-quality": fetch_json(LIVE_AIR_QUALITY, dict(coords, **RECORD_AIR_QUALITY)),
+        "geocoding": {"results": [], "generationtime_ms": 0.5},
+    }
+    for name in RECORD_PLACES:
+        found = fetch_json(LIVE_SEARCH, {"name": name, "count": 1, "language": "en", "format": "json"})
+        responses["geocoding"]["results"] += found.get("results", [])
+    for name, body in responses.items():
+        (root / f"{name}.json").write_text(json.dumps(body, ensure_ascii=False, separators=(",", ":")))
+        print(f"{name}: {root / f'{name}.json'}")
+
+# ---------------------------------------------------
+# MAIN
+# ---------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Open-Meteo APIs.")
+    sub = parser.add_subparsers(dest="command")
+    rec = sub.add_parser("record", help="refresh the fixtures from the live APIs")
+    rec.add_argument("--lat", type=float, default=48.8566)
+    rec.add_argument("--lon", type=float, default=2.3522)
+    parser.add_argument("--fixtures", type=pathlib.Path, default=FIXTURES_DIR)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--profile", choices=PROFILES, default="healthy")
+    parser.add_argument("--latency", type=float, help="ms added to every answer")
+    parser.add_argument("--jitter", type=float, help="± ms around the latency")
+    parser.add_argument("--error-rate", type=float, help="share of requests answered 503")
+    parser.add_argument("--hang-rate", type=float, help="share of requests never answered")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.fixtures, args.lat, args.lon)
+        return
+
+    profile = dict(PROFILES[args.profile])
+    for key in ["latency", "jitter", "error_rate", "hang_rate"]:
+        if getattr(args, key) is not None: profile[key] = getattr(args, key)
+    server = StubServer(args.port, profile, load_fixtures(args.fixtures), args.seed, args.verbose)
+    print(f"Serving {args.profile} {profile} on {server.url}")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+
+if __name__ == "__main__":
+    main()
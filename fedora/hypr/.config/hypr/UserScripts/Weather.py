@@ -10,6 +10,7 @@ import os
 import sys
 import time
 import html
+import urllib.parse
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple, TypeVar, Union, cast
 from typing import NamedTuple
@@ -89,6 +90,18 @@ TIMEOUT = 8
 SESSION = requests.Session()
 SESSION.headers.update({"User-Agent": UA})
 
+# Optional API host override, e.g. the local stand-in from bench/openmeteo_stub.py:
+#   WEATHER_API_URL=http://127.0.0.1:8765 python3 ~/.config/hypr/UserScripts/Weather.py
+# Open-Meteo and Nominatim requests then go to that host, under the same paths.
+API_URL = os.getenv("WEATHER_API_URL", "").rstrip("/")
+
+
+def api_url(url: str) -> str:
+    """Moves an API URL onto API_URL when it is set."""
+    if not API_URL:
+        return url
+    return API_URL + urllib.parse.urlsplit(url).path
+
 # =============== Icon and status mapping ===============
 # Reuse prior icon set for continuity
 WEATHER_ICONS = {
@@ -345,7 +358,7 @@ def get_coords_from_place_name(name: str) -> Optional[Tuple[float, float]]:
             "language": os.getenv("WEATHER_LANG", "en"),
             "format": "json",
         }
-        resp = SESSION.get(base, params=params, timeout=TIMEOUT)
+        resp = SESSION.get(api_url(base), params=params, timeout=TIMEOUT)
         resp.raise_for_status()
         data = ensure_dict(resp.json())
         results = ensure_list(data.get("results"))
@@ -437,7 +450,7 @@ def fetch_open_meteo(lat: float, lon: float) -> Dict[str, Any]:
         "timezone": "auto",
     }
     params.update(units_params(UNITS))
-    resp = SESSION.get(base, params=params, timeout=TIMEOUT)
+    resp = SESSION.get(api_url(base), params=params, timeout=TIMEOUT)
     resp.raise_for_status()
     return resp.json()
 
@@ -451,7 +464,7 @@ def fetch_aqi(lat: float, lon: float) -> Optional[Dict[str, Any]]:
             "current": "european_aqi",
             "timezone": "auto",
         }
-        resp = SESSION.get(base, params=params, timeout=TIMEOUT)
+        resp = SESSION.get(api_url(base), params=params, timeout=TIMEOUT)
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
@@ -491,7 +504,7 @@ def extract_place_parts_open_meteo(p: JSONDict) -> List[str]:
 
 def reverse_geocode(base: str, params: Dict[str, Union[str, float]], headers: Optional[Dict[str, str]] = None) -> Optional[str]:
     try:
-        resp = SESSION.get(base, params=params, headers=headers, timeout=TIMEOUT)
+        resp = SESSION.get(api_url(base), params=params, headers=headers, timeout=TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         data_dict = ensure_dict(data)
@@ -512,7 +525,7 @@ def reverse_geocode_open_meteo(lat: float, lon: float, lang: str) -> Optional[st
             "language": lang,
             "format": "json",
         }
-        resp = SESSION.get(base, params=params, timeout=TIMEOUT)
+        resp = SESSION.get(api_url(base), params=params, timeout=TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         data_dict = ensure_dict(data)